@@ -0,0 +1,171 @@
+"""
+EXIF 拍摄日期读取与持久化索引
+
+JPEG 只读取 APP1 段、TIFF 只读取文件头和IFD，直接解析其中的 TIFF 结构，
+取出 DateTimeOriginal、DateTimeDigitized、DateTime 三个标签，不创建图片对象；
+其他格式交给 Pillow 只读取元数据。
+读取结果按 (路径, 文件大小, 修改时间) 保存在磁盘索引中，未变化的文件下次无需再打开。
+"""
+import io
+import json
+import os
+import struct
+
+from PIL import Image
+
+INDEX_PATH = os.path.join(os.path.expanduser("~"), ".image_watermark", "exif_dates.json")
+INDEX_VERSION = 1
+
+TAG_DATETIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_DATETIME_DIGITIZED = 0x9004
+# 按优先级排列的日期标签
+DATE_TAGS = (TAG_DATETIME_ORIGINAL, TAG_DATETIME_DIGITIZED, TAG_DATETIME)
+
+TYPE_ASCII = 2
+TYPE_LONG = 4
+TYPE_IFD = 13
+MAX_IFD_ENTRIES = 1000  # 超过时视为损坏的数据
+
+
+def _read_ifd(f, base, offset, order, wanted):
+    """读取一个IFD中需要的标签，返回 {标签: 值}（只支持字符串和单个整数）"""
+    f.seek(base + offset)
+    data = f.read(2)
+    if len(data) < 2:
+        return {}
+    count = struct.unpack(order + "H", data)[0]
+    if count > MAX_IFD_ENTRIES:
+        return {}
+    data = f.read(count * 12)
+
+    found = {}
+    for i in range(len(data) // 12):
+        tag, value_type, value_count, value = struct.unpack_from(order + "HHI4s", data, i * 12)
+        if tag not in wanted:
+            continue
+        if value_type == TYPE_ASCII:
+            # 不超过4字节的值直接存放在条目中，否则条目中是偏移量
+            if value_count <= 4:
+                raw = value[:value_count]
+            else:
+                f.seek(base + struct.unpack(order + "I", value)[0])
+                raw = f.read(value_count)
+            found[tag] = raw.split(b"\0", 1)[0].decode("ascii", "replace").strip()
+        elif value_type in (TYPE_LONG, TYPE_IFD) and value_count == 1:
+            found[tag] = struct.unpack(order + "I", value)[0]
+    return found
+
+
+def _first_date(tags):
+    """按优先级返回第一个非空的日期字符串"""
+    for tag in DATE_TAGS:
+        value = tags.get(tag)
+        # 部分相机在没有日期时写入空格或 "0000:00:00 00:00:00"
+        if isinstance(value, str) and value.strip(" :0"):
+            return value
+    return None
+
+
+def _parse_tiff(f, base=0):
+    """解析从 base 开始的 TIFF 结构，返回日期字符串或None"""
+    f.seek(base)
+    header = f.read(8)
+    if len(header) < 8:
+        return None
+    order = {b"II": "<", b"MM": ">"}.get(header[:2])
+    if order is None:
+        return None
+    magic, ifd0_offset = struct.unpack(order + "HI", header[2:])
+    if magic != 42:
+        return None
+
+    tags = _read_ifd(f, base, ifd0_offset, order, {TAG_DATETIME, TAG_EXIF_IFD})
+    exif_offset = tags.get(TAG_EXIF_IFD)
+    if isinstance(exif_offset, int):
+        tags.update(_read_ifd(f, base, exif_offset, order, {TAG_DATETIME_ORIGINAL, TAG_DATETIME_DIGITIZED}))
+    return _first_date(tags)
+
+
+def _read_jpeg(f):
+    """逐个跳过JPEG文件头中的段，找到EXIF所在的APP1段（f 位于SOI标记之后）"""
+    while True:
+        marker = f.read(4)
+        if len(marker) < 4 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        length = struct.unpack(">H", marker[2:])[0]
+        if code in (0xDA, 0xD9):  # 图像数据开始或文件结束，后面不会再有EXIF
+            return None
+        if code == 0xE1:
+            segment = f.read(length - 2)
+            if segment.startswith(b"Exif\0\0"):
+                return _parse_tiff(io.BytesIO(segment), 6)
+            continue  # 其他APP1段（如XMP）
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def _read_with_pillow(path):
+    """其他格式：由Pillow读取元数据（只解析文件头，不解码像素）"""
+    with Image.open(path) as img:
+        exif = img.getexif()
+        tags = dict(exif.get_ifd(TAG_EXIF_IFD))
+        tags[TAG_DATETIME] = exif.get(TAG_DATETIME)
+    return _first_date(tags)
+
+
+def read_exif_date(path):
+    """读取图片的EXIF拍摄日期，返回 "YYYY:MM:DD HH:MM:SS" 格式的字符串，没有日期时返回None"""
+    with open(path, "rb") as f:
+        head = f.read(4)
+        if head[:2] == b"\xff\xd8":
+            f.seek(2)
+            return _read_jpeg(f)
+        if head in (b"II*\0", b"MM\0*"):
+            return _parse_tiff(f)
+    return _read_with_pillow(path)
+
+
+class ExifDateIndex:
+    """按 (路径, 文件大小, 修改时间) 缓存EXIF日期的磁盘索引"""
+
+    def __init__(self, index_path=INDEX_PATH):
+        self.index_path = index_path
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # 真实路径 -> [文件大小, 修改时间(纳秒), 日期或None]
+        self._dirty = False
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                self._entries = data["entries"]
+        except (OSError, ValueError, KeyError):
+            pass  # 没有索引或索引损坏时重新读取
+
+    def get_date(self, path):
+        """获取图片的EXIF日期（优先使用索引），读取失败时抛出异常且不写入索引"""
+        stat = os.stat(path)
+        key = os.path.realpath(path)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            self.hits += 1
+            return entry[2]
+
+        self.misses += 1
+        date = read_exif_date(path)
+        self._entries[key] = [stat.st_size, stat.st_mtime_ns, date]
+        self._dirty = True
+        return date
+
+    def save(self):
+        """保存索引（先写临时文件再替换）"""
+        if not self._dirty:
+            return
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": INDEX_VERSION, "entries": self._entries}, f, ensure_ascii=False)
+        os.replace(temp_path, self.index_path)
+        self._dirty = False
@@ -1,38 +1,63 @@
 import os
+import sys
 import argparse
-from PIL import Image, ImageDraw, ImageFont, ExifTags
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFont
 from datetime import datetime
 
+from exif_index import ExifDateIndex, read_exif_date
 
-def get_exif_date(image_path):
-    """从图片的EXIF信息中获取拍摄日期"""
+
+def get_exif_date(image_path, log=print, index=None):
+    """从图片的EXIF信息中获取拍摄日期（只解析文件头；传入 index 时优先使用日期索引）"""
     try:
-        with Image.open(image_path) as img:
-            exif_data = img.getexif()
-
-            # 查找日期时间标签
-            date_tags = ['DateTimeOriginal', 'DateTimeDigitized', 'DateTime']
-            date_tag_ids = {tag: id for id, tag in ExifTags.TAGS.items() if tag in date_tags}
-
-            for tag in date_tags:
-                if tag in date_tag_ids and date_tag_ids[tag] in exif_data:
-                    date_str = exif_data[date_tag_ids[tag]]
-                    # 解析日期格式 (通常是 "YYYY:MM:DD HH:MM:SS")
-                    date_obj = datetime.strptime(date_str, "%Y:%m:%d %H:%M:%S")
-                    return date_obj.strftime("%Y-%m-%d")
-
-            # 如果没有找到EXIF日期，返回文件修改日期
-            file_mtime = os.path.getmtime(image_path)
-            date_obj = datetime.fromtimestamp(file_mtime)
+        date_str = index.get_date(image_path) if index is not None else read_exif_date(image_path)
+        if date_str:
+            # 解析日期格式 (通常是 "YYYY:MM:DD HH:MM:SS")
+            date_obj = datetime.strptime(date_str, "%Y:%m:%d %H:%M:%S")
             return date_obj.strftime("%Y-%m-%d")
 
+        # 如果没有找到EXIF日期，返回文件修改日期
+        file_mtime = os.path.getmtime(image_path)
+        date_obj = datetime.fromtimestamp(file_mtime)
+        return date_obj.strftime("%Y-%m-%d")
+
     except Exception as e:
-        print(f"获取EXIF信息失败: {e}")
+        log(f"获取EXIF信息失败: {e}")
         # 失败时返回当前日期
         return datetime.now().strftime("%Y-%m-%d")
 
 
-def add_watermark(image_path, output_path, text, font_size=30, color=(255, 255, 255), position='bottom_right'):
+@lru_cache(maxsize=None)
+def find_font_path():
+    """查找系统中可用的水印字体文件（每个进程只查找一次），找不到时返回None"""
+    # 尝试不同操作系统的常见字体
+    if os.name == 'nt':  # Windows
+        return "arial.ttf"
+    elif os.name == 'posix':  # macOS/Linux
+        # macOS通常的字体路径 / Linux通常的字体路径
+        for path in ("/Library/Fonts/Arial.ttf", "/usr/share/fonts/truetype/freefont/FreeSans.ttf"):
+            if os.path.exists(path):
+                return path
+    return None
+
+
+@lru_cache(maxsize=16)
+def load_font(font_size):
+    """加载水印字体（按字号缓存），失败时使用默认字体"""
+    font_path = find_font_path()
+    if font_path:
+        try:
+            return ImageFont.truetype(font_path, font_size)
+        except OSError:
+            pass
+    return ImageFont.load_default()
+
+
+def add_watermark(image_path, output_path, text, font_size=30, color=(255, 255, 255), position='bottom_right',
+                  log=print):
     """给图片添加水印"""
     try:
         with Image.open(image_path) as img:
@@ -47,24 +72,8 @@ def add_watermark(image_path, output_path, text, font_size=30, color=(255, 255,
             # 创建绘制对象
             draw = ImageDraw.Draw(img)
 
-            # 尝试加载系统字体，如失败则使用默认字体
-            try:
-                # 尝试不同操作系统的常见字体
-                if os.name == 'nt':  # Windows
-                    font = ImageFont.truetype("arial.ttf", font_size)
-                elif os.name == 'posix':  # macOS/Linux
-                    # macOS通常的字体路径
-                    if os.path.exists("/Library/Fonts/Arial.ttf"):
-                        font = ImageFont.truetype("/Library/Fonts/Arial.ttf", font_size)
-                    # Linux通常的字体路径
-                    elif os.path.exists("/usr/share/fonts/truetype/freefont/FreeSans.ttf"):
-                        font = ImageFont.truetype("/usr/share/fonts/truetype/freefont/FreeSans.ttf", font_size)
-                    else:
-                        font = ImageFont.load_default()
-                else:
-                    font = ImageFont.load_default()
-            except:
-                font = ImageFont.load_default()
+            # 加载系统字体（已缓存），如失败则使用默认字体
+            font = load_font(font_size)
 
             # 获取文本尺寸 - 使用textbbox替代textsize（兼容Pillow 10.0.0+）
             # textbbox返回(x0, y0, x1, y1)，分别是文本框的左上角和右下角坐标
@@ -99,14 +108,64 @@ def add_watermark(image_path, output_path, text, font_size=30, color=(255, 255,
 
             # 保存图片
             img.save(output_path)
-            print(f"已保存带水印图片: {output_path}")
+            log(f"已保存带水印图片: {output_path}")
             return True
 
     except Exception as e:
-        print(f"添加水印失败: {e}")
+        log(f"添加水印失败: {e}")
         return False
 
 
+def process_image(img_path, output_dir, font_size, color, position, watermark_text=None):
+    """处理单张图片，返回 (是否成功, 输出信息列表)，输出由调用方按顺序打印"""
+    messages = []
+    # 获取水印文本（EXIF日期），调用方已通过日期索引获取时直接使用
+    if watermark_text is None:
+        watermark_text = get_exif_date(img_path, log=messages.append)
+
+    # 生成输出文件路径
+    filename = os.path.basename(img_path)
+    name, ext = os.path.splitext(filename)
+    output_path = os.path.join(output_dir, f"{name}_watermark{ext}")
+
+    # 添加水印
+    success = add_watermark(img_path, output_path, watermark_text,
+                            font_size=font_size,
+                            color=color,
+                            position=position,
+                            log=messages.append)
+    return success, messages
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+
+
+def iter_image_files(directory):
+    """用一次 scandir 遍历逐个产出目录下的图片文件（扫描时已得到文件类型，无需逐个 isfile）"""
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                yield entry
+
+
+def run_jobs(job_args, jobs):
+    """按输入顺序逐个产出 process_image 的结果；job_args 为每张图片的参数元组，
+    jobs > 1 时使用进程池，在途任务数不超过 jobs 的两倍"""
+    if jobs <= 1:
+        for args in job_args:
+            yield process_image(*args)
+        return
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        in_flight = deque()
+        for args in job_args:
+            if len(in_flight) >= jobs * 2:
+                yield in_flight.popleft().result()
+            in_flight.append(executor.submit(process_image, *args))
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
 def main():
     # 解析命令行参数
     parser = argparse.ArgumentParser(description='给图片添加基于EXIF日期的水印')
@@ -116,6 +175,7 @@ def main():
     parser.add_argument('--position', type=str, default='bottom_right',
                         choices=['top_left', 'top_right', 'bottom_left', 'bottom_right', 'center'],
                         help='水印位置')
+    parser.add_argument('--jobs', '-j', type=int, default=1, help='并行处理的进程数，默认 1（串行）')
 
     args = parser.parse_args()
 
@@ -132,21 +192,18 @@ def main():
     image_files = []
     if os.path.isdir(args.image_path):
         # 如果输入是目录，处理目录下的所有图片
-        for filename in os.listdir(args.image_path):
-            path = os.path.join(args.image_path, filename)
-            if os.path.isfile(path) and filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-                image_files.append(path)
-    elif os.path.isfile(args.image_path) and args.image_path.lower().endswith(
-            ('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
+        entries = sorted(iter_image_files(args.image_path), key=lambda entry: entry.name)
+        image_files = [entry.path for entry in entries]
+    elif os.path.isfile(args.image_path) and args.image_path.lower().endswith(IMAGE_EXTENSIONS):
         # 如果输入是单个图片文件
         image_files.append(args.image_path)
     else:
         print("无效的图片路径或文件格式")
-        return
+        return 1
 
     if not image_files:
         print("未找到任何图片文件")
-        return
+        return 1
 
     # 创建输出目录
     if os.path.isdir(args.image_path):
@@ -157,22 +214,28 @@ def main():
 
     os.makedirs(output_dir, exist_ok=True)
 
-    # 处理每张图片
-    for img_path in image_files:
-        # 获取水印文本（EXIF日期）
-        watermark_text = get_exif_date(img_path)
+    # 先通过日期索引获取所有图片的拍摄日期（只读文件头，未变化的文件直接使用索引）
+    date_index = ExifDateIndex()
+    watermark_texts = [get_exif_date(img_path, index=date_index) for img_path in image_files]
+    try:
+        date_index.save()
+    except OSError as e:
+        print(f"保存日期索引失败: {e}")
 
-        # 生成输出文件路径
-        filename = os.path.basename(img_path)
-        name, ext = os.path.splitext(filename)
-        output_path = os.path.join(output_dir, f"{name}_watermark{ext}")
+    # 处理每张图片（结果按输入顺序输出，与进程数无关）
+    job_args = ((img_path, output_dir, args.font_size, color, args.position, watermark_text)
+                for img_path, watermark_text in zip(image_files, watermark_texts))
+    success_count = 0
+    for success, messages in run_jobs(job_args, max(1, args.jobs)):
+        for message in messages:
+            print(message)
+        if success:
+            success_count += 1
 
-        # 添加水印
-        add_watermark(img_path, output_path, watermark_text,
-                      font_size=args.font_size,
-                      color=color,
-                      position=args.position)
+    failed_count = len(image_files) - success_count
+    print(f"处理完成: 成功 {success_count} 张, 失败 {failed_count} 张")
+    return 1 if failed_count else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
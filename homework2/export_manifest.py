@@ -0,0 +1,132 @@
+"""
+增量导出清单
+
+每个输出文件夹中保存一个清单，记录每个输出文件由哪张原图（路径、大小、修改时间）、
+哪套渲染参数和编码参数生成，以及输出文件本身的大小和修改时间。
+再次导出时，原图、参数和输出文件都没有变化的图片直接跳过。
+"""
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = ".image_processor_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_fingerprint(path):
+    """文件指纹 [大小, 修改时间(纳秒)]，文件不存在时返回None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def spec_digest(spec):
+    """渲染参数的摘要；使用图片水印时包含水印图片的指纹，水印文件被替换后同样需要重新导出"""
+    parts = [repr(spec)]
+    if spec.watermark.type == "image" and spec.watermark.image.path:
+        parts.append(repr(file_fingerprint(spec.watermark.image.path)))
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class ExportManifest:
+    """一个输出文件夹的导出清单：输出文件名 -> 生成它的原图、参数和输出文件指纹"""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, MANIFEST_NAME)
+        self.entries = {}
+        self._dirty = False
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data["entries"]
+        except (OSError, ValueError, KeyError):
+            pass  # 没有清单或清单损坏时视为全部需要导出
+
+    def _entry(self, task, digest, source_fingerprint):
+        return {
+            "source": os.path.realpath(task.source_path),
+            "source_fingerprint": source_fingerprint,
+            "spec": digest,
+            "output": list(task.spec.output),
+        }
+
+    def is_up_to_date(self, task, digest, source_fingerprint):
+        """输出文件是否已由相同的原图和参数生成且未被改动"""
+        name = os.path.basename(task.output_path)
+        recorded = self.entries.get(name)
+        if recorded is None:
+            return False
+        expected = self._entry(task, digest, source_fingerprint)
+        if any(recorded.get(key) != value for key, value in expected.items()):
+            return False
+        return recorded.get("output_fingerprint") == file_fingerprint(task.output_path)
+
+    def record(self, task, digest, source_fingerprint):
+        """记录刚导出成功的文件，source_fingerprint 为导出前取得的原图指纹"""
+        entry = self._entry(task, digest, source_fingerprint)
+        entry["output_fingerprint"] = file_fingerprint(task.output_path)
+        self.entries[os.path.basename(task.output_path)] = entry
+        self._dirty = True
+
+    def save(self):
+        """保存清单（先写临时文件再替换）"""
+        if not self._dirty:
+            return
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "entries": self.entries}, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+        self._dirty = False
+
+
+class IncrementalPlan:
+    """按输出文件夹分组的清单集合，用于筛选需要导出的任务和记录结果"""
+
+    def __init__(self):
+        self._manifests = {}  # 输出文件夹 -> ExportManifest
+        self._digests = {}  # 渲染参数 -> 摘要
+        # 原图路径 -> 筛选任务时的原图指纹；导出过程中原图被修改时，记录的仍是导出前的指纹，下次会重新导出
+        self._source_fingerprints = {}
+
+    def _manifest(self, task):
+        output_dir = os.path.dirname(os.path.abspath(task.output_path))
+        manifest = self._manifests.get(output_dir)
+        if manifest is None:
+            manifest = self._manifests[output_dir] = ExportManifest(output_dir)
+        return manifest
+
+    def _digest(self, spec):
+        digest = self._digests.get(spec)
+        if digest is None:
+            digest = self._digests[spec] = spec_digest(spec)
+        return digest
+
+    def split(self, tasks):
+        """把任务分为 (需要导出的任务, 已是最新而跳过的任务)"""
+        pending, skipped = [], []
+        for task in tasks:
+            source_fingerprint = self._source_fingerprints.setdefault(task.source_path,
+                                                                      file_fingerprint(task.source_path))
+            if self._manifest(task).is_up_to_date(task, self._digest(task.spec), source_fingerprint):
+                skipped.append(task)
+            else:
+                pending.append(task)
+        return pending, skipped
+
+    def record(self, task):
+        """记录导出成功的任务"""
+        self._manifest(task).record(task, self._digest(task.spec), self._source_fingerprints[task.source_path])
+
+    def save(self):
+        """保存所有有变化的清单，返回 [(清单路径, 错误信息)]"""
+        errors = []
+        for manifest in self._manifests.values():
+            try:
+                manifest.save()
+            except OSError as e:
+                errors.append((manifest.path, str(e)))
+        return errors
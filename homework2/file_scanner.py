@@ -0,0 +1,58 @@
+"""
+图片文件扫描
+
+用 os.scandir 一次遍历目录，边扫描边产出匹配的文件（不必等整个目录树列完），
+产出的 os.DirEntry 自带扫描时得到的文件类型和 stat 信息，后续无需再单独 stat。
+"""
+import os
+from fnmatch import fnmatchcase
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.gif')
+
+
+def is_image_name(name, extensions=IMAGE_EXTENSIONS):
+    """按扩展名判断是否为支持的图片（不区分大小写）"""
+    return name.lower().endswith(extensions)
+
+
+def _matches(name, patterns):
+    """文件名是否匹配任一通配符（不区分大小写）"""
+    name = name.lower()
+    return any(fnmatchcase(name, pattern.lower()) for pattern in patterns)
+
+
+def scan_images(root, recursive=False, include=None, exclude=None, extensions=IMAGE_EXTENSIONS):
+    """逐个产出目录下的图片文件（os.DirEntry）
+
+    include: 文件名需匹配的通配符列表（如 ["IMG_*"]），为空时不限制
+    exclude: 要跳过的文件或子目录名通配符列表（如 [".*", "thumbs"]）
+    同一目录中的文件按扫描顺序产出；不跟随指向目录的符号链接，避免循环。
+    """
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError:
+            continue  # 没有权限或目录已删除
+        subdirs = []
+        with entries:
+            for entry in entries:
+                if exclude and _matches(entry.name, exclude):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            subdirs.append(entry.path)
+                        continue
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    continue
+                if not is_image_name(entry.name, extensions):
+                    continue
+                if include and not _matches(entry.name, include):
+                    continue
+                yield entry
+        # 子目录按名称逆序入栈，保证按名称顺序深度优先遍历
+        pending.extend(sorted(subdirs, reverse=True))
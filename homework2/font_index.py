@@ -0,0 +1,187 @@
+"""
+字体索引与字体缓存
+
+首次使用时扫描系统字体目录，建立 字体家族/粗体/斜体 -> 字体文件 的索引（并保存到磁盘，
+下次启动或子进程中直接读取）；加载后的 FreeType 字体按 (文件, 编号, 字号) 做LRU缓存。
+"""
+import json
+import os
+import sys
+import threading
+from functools import lru_cache
+
+from PIL import ImageFont
+
+FONT_EXTENSIONS = ('.ttf', '.ttc', '.otf', '.otc')
+INDEX_PATH = os.path.join(os.path.expanduser("~"), ".image_processor_cache", "font_index.json")
+
+# 常见中文字体的本地化名称 -> 字体文件中的英文家族名
+FONT_ALIASES = {
+    "黑体": "SimHei",
+    "宋体": "SimSun",
+    "新宋体": "NSimSun",
+    "仿宋": "FangSong",
+    "楷体": "KaiTi",
+    "微软雅黑": "Microsoft YaHei",
+    "等线": "DengXian",
+    "华文黑体": "STHeiti",
+    "苹方-简": "PingFang SC",
+}
+
+
+def system_font_dirs():
+    """当前系统的字体目录"""
+    home = os.path.expanduser("~")
+    if os.name == 'nt':
+        windir = os.environ.get("WINDIR", r"C:\Windows")
+        return [os.path.join(windir, "Fonts"),
+                os.path.join(os.environ.get("LOCALAPPDATA", home), "Microsoft", "Windows", "Fonts")]
+    if sys.platform == 'darwin':
+        return ["/System/Library/Fonts", "/Library/Fonts", os.path.join(home, "Library", "Fonts")]
+    data_home = os.environ.get("XDG_DATA_HOME", os.path.join(home, ".local", "share"))
+    return ["/usr/share/fonts", "/usr/local/share/fonts", os.path.join(data_home, "fonts"),
+            os.path.join(home, ".fonts")]
+
+
+def normalize_family(family):
+    """统一字体家族名的写法（忽略大小写和空格）"""
+    family = FONT_ALIASES.get(family, family)
+    return family.replace(" ", "").lower()
+
+
+def is_plain_style(style):
+    """是否为常规的样式名（同一样式有多个文件时优先使用，例如 Regular 优先于 Light）"""
+    return (style or "").lower() in ("regular", "normal", "book", "roman", "bold", "italic", "oblique",
+                                     "bold italic", "bold oblique")
+
+
+def parse_style(style):
+    """从字体样式名判断是否为粗体/斜体"""
+    style = (style or "").lower()
+    bold = any(word in style for word in ("bold", "black", "heavy", "semibold", "demibold"))
+    italic = "italic" in style or "oblique" in style
+    return bold, italic
+
+
+class FontIndex:
+    """字体家族/样式到字体文件的索引"""
+
+    def __init__(self, font_dirs=None, index_path=INDEX_PATH):
+        self.font_dirs = font_dirs if font_dirs is not None else system_font_dirs()
+        self.index_path = index_path
+        self._families = None  # 规范化家族名 -> {"粗体,斜体": [文件路径, 字体编号]}
+        self._lock = threading.Lock()
+
+    def _dirs_signature(self):
+        """字体目录的修改时间，字体安装或删除后索引失效"""
+        signature = {}
+        for font_dir in self.font_dirs:
+            try:
+                signature[font_dir] = os.stat(font_dir).st_mtime
+            except OSError:
+                pass
+        return signature
+
+    def _scan(self):
+        """扫描字体目录，读取每个字体文件的家族名和样式"""
+        families = {}
+        for font_dir in self.font_dirs:
+            for dir_path, _, file_names in os.walk(font_dir):
+                for file_name in file_names:
+                    if not file_name.lower().endswith(FONT_EXTENSIONS):
+                        continue
+                    path = os.path.join(dir_path, file_name)
+                    face_index = 0
+                    while True:
+                        try:
+                            font = ImageFont.truetype(path, 10, index=face_index)
+                        except OSError:
+                            break  # 超出字体集合中的字体数量或文件无法读取
+                        family, style = font.getname()
+                        if family:
+                            bold, italic = parse_style(style)
+                            styles = families.setdefault(normalize_family(family), {})
+                            key = f"{int(bold)},{int(italic)}"
+                            if key not in styles or is_plain_style(style):
+                                styles[key] = [path, face_index]
+                        if not file_name.lower().endswith(('.ttc', '.otc')):
+                            break
+                        face_index += 1
+        return families
+
+    def _load(self):
+        """读取磁盘上的索引，不存在或已过期时重新扫描"""
+        signature = self._dirs_signature()
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("signature") == signature:
+                return data["families"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        families = self._scan()
+        try:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            temp_path = f"{self.index_path}.{os.getpid()}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({"signature": signature, "families": families}, f, ensure_ascii=False)
+            os.replace(temp_path, self.index_path)
+        except OSError as e:
+            print(f"保存字体索引失败: {e}")
+        return families
+
+    @property
+    def families(self):
+        if self._families is None:
+            with self._lock:
+                if self._families is None:
+                    self._families = self._load()
+        return self._families
+
+    def resolve(self, family, bold=False, italic=False):
+        """查找字体文件，返回 (文件路径, 字体编号)，找不到时返回None"""
+        styles = self.families.get(normalize_family(family))
+        if not styles:
+            return None
+        # 优先完全匹配，其次只匹配粗体，最后使用常规字体或任意样式
+        for key in (f"{int(bold)},{int(italic)}", f"{int(bold)},0", "0,0"):
+            if key in styles:
+                return tuple(styles[key])
+        return tuple(next(iter(styles.values())))
+
+
+_default_index = FontIndex()
+
+
+@lru_cache(maxsize=64)
+def _load_truetype(path, face_index, size):
+    """加载字体文件（按文件、编号、字号缓存）"""
+    return ImageFont.truetype(path, size, index=face_index)
+
+
+@lru_cache(maxsize=16)
+def _load_default(size):
+    """加载Pillow内置字体"""
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:  # Pillow 10.1 之前不支持字号参数
+        return ImageFont.load_default()
+
+
+def get_font(family, size, bold=False, italic=False):
+    """按字体家族和样式获取字体，找不到时使用默认字体"""
+    # 字体文件路径或文件名（如 arial.ttf）直接交给FreeType查找
+    if os.path.splitext(family)[1].lower() in FONT_EXTENSIONS:
+        try:
+            return _load_truetype(family, 0, size)
+        except OSError:
+            return _load_default(size)
+
+    resolved = _default_index.resolve(family, bold, italic)
+    if resolved is not None:
+        try:
+            return _load_truetype(resolved[0], resolved[1], size)
+        except OSError:
+            pass
+    return _load_default(size)
@@ -0,0 +1,42 @@
+"""
+图片解码
+
+目标尺寸远小于原图时，JPEG 使用 draft（解码时直接缩小 1/2、1/4、1/8），
+其他格式使用 reduce（整数倍盒式缩小）后再做高质量缩放，避免每次都完整解码、完整缩放。
+"""
+from PIL import Image
+
+# 缩小解码后的尺寸至少保留为目标尺寸的倍数，保证后续LANCZOS缩放的质量
+REDUCING_GAP = 2.0
+
+
+def draft_for_size(img, target_size, reducing_gap=REDUCING_GAP):
+    """对尚未解码的JPEG按目标尺寸启用缩小解码，返回是否生效（必须在load之前调用）"""
+    requested = (int(target_size[0] * reducing_gap), int(target_size[1] * reducing_gap))
+    if requested[0] >= img.width or requested[1] >= img.height:
+        return False
+    return img.draft(None, requested) is not None
+
+
+def downscale(img, size, resample=Image.Resampling.LANCZOS, reducing_gap=REDUCING_GAP):
+    """缩放图片，缩小倍数较大时先用reduce整数倍缩小"""
+    if size[0] < img.width and size[1] < img.height:
+        draft_for_size(img, size, reducing_gap)
+        return img.resize(size, resample, reducing_gap=reducing_gap)
+    return img.resize(size, resample)
+
+
+def decode_image(path):
+    """完整解码一张图片，返回与文件无关联的图片对象"""
+    with Image.open(path) as img:
+        img.load()
+        return img.copy()
+
+
+def load_thumbnail(path, max_size):
+    """生成缩略图，返回 (缩略图, 原图尺寸, 原图模式)"""
+    with Image.open(path) as img:
+        size, mode = img.size, img.mode
+        draft_for_size(img, max_size)
+        img.thumbnail(max_size, reducing_gap=REDUCING_GAP)
+        return img.copy(), size, mode
@@ -0,0 +1,103 @@
+"""
+后台导入
+
+在线程池中读取图片信息、生成缩略图（Pillow 解码和缩放时会释放GIL），按输入顺序分批交回调用方。
+PhotoImage 只能在Tk线程中创建，因此这里只产出PIL缩略图。
+"""
+import os
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from image_store import normalize_path
+
+# 一张导入成功的图片（thumbnail 为PIL图片）
+ImportedImage = namedtuple("ImportedImage", ["path", "thumbnail", "size", "mode", "mtime"])
+# 导入结果：成功数量、[(路径, 错误信息)]、是否被取消
+ImportResult = namedtuple("ImportResult", ["imported_count", "errors", "cancelled"])
+
+
+def default_workers():
+    """默认的导入线程数"""
+    return min(8, os.cpu_count() or 1)
+
+
+def load_image_info(item, thumbnail_cache):
+    """读取一张图片的信息和缩略图，item 为路径或扫描得到的 os.DirEntry（复用其stat信息）"""
+    path = os.fspath(item)
+    stat = item.stat() if isinstance(item, os.DirEntry) else None
+    thumbnail, size, mode, mtime = thumbnail_cache.load(path, stat)
+    return ImportedImage(path, thumbnail, size, mode, mtime)
+
+
+def _load(item, thumbnail_cache):
+    """在线程池中执行，返回 (ImportedImage, None) 或 (None, (路径, 错误信息))"""
+    try:
+        return load_image_info(item, thumbnail_cache), None
+    except Exception as e:
+        return None, (os.fspath(item), str(e))
+
+
+def run_import(items, thumbnail_cache, workers=None, skip_paths=(), on_batch=None, cancel_event=None,
+               batch_size=32, batch_interval=0.2):
+    """并行导入图片，返回 ImportResult
+
+    items: 路径或 os.DirEntry 的可迭代对象（可以是边扫描边产出的生成器）
+    skip_paths: 已导入图片的规范化路径，这些文件以及 items 中重复的文件会被跳过
+    on_batch(图片列表, 已处理数量): 每凑满 batch_size 张或距上次超过 batch_interval 秒时调用一次
+    """
+    workers = workers or default_workers()
+    seen = set(skip_paths)
+    errors = []
+    batch = []
+    state = {"imported": 0, "last_flush": time.monotonic()}
+
+    def unique(items):
+        for item in items:
+            key = normalize_path(os.fspath(item))
+            if key not in seen:
+                seen.add(key)
+                yield item
+
+    def flush():
+        if on_batch is not None and (batch or errors):
+            on_batch(list(batch), state["imported"] + len(errors))
+        batch.clear()
+        state["last_flush"] = time.monotonic()
+
+    def collect(future):
+        info, error = future.result()
+        if error is not None:
+            errors.append(error)
+        else:
+            batch.append(info)
+            state["imported"] += 1
+        if len(batch) >= batch_size or time.monotonic() - state["last_flush"] >= batch_interval:
+            flush()
+
+    def is_cancelled():
+        return cancel_event is not None and cancel_event.is_set()
+
+    cancelled = False
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # 在途任务数不超过线程数的两倍，生成器输入不会被一次性读完
+        in_flight = deque()
+        for item in unique(items):
+            if is_cancelled():
+                cancelled = True
+                break
+            if len(in_flight) >= workers * 2:
+                collect(in_flight.popleft())
+            in_flight.append(executor.submit(_load, item, thumbnail_cache))
+
+        while in_flight:
+            if cancelled or is_cancelled():
+                cancelled = True
+                for future in in_flight:
+                    future.cancel()
+                break
+            collect(in_flight.popleft())
+
+    # 取消时已完成的图片仍然交回调用方
+    flush()
+    return ImportResult(state["imported"], errors, cancelled)
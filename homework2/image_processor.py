@@ -2,12 +2,27 @@ import os
 import json
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox, colorchooser, simpledialog
-from PIL import Image, ImageTk, ImageDraw, ImageFont, ImageOps
-import glob
+from PIL import Image, ImageTk, ImageOps
 import sys
-import math
+import queue
+import threading
+import multiprocessing
 from datetime import datetime
 
+import render_engine
+import watermark_geometry
+import parallel_export
+import image_import
+from image_store import ImageRecord, ImageRegistry, PixelCache
+from image_decode import downscale
+from thumbnail_cache import ThumbnailCache
+from preview_scheduler import PreviewScheduler, BackgroundRenderer
+from thumbnail_grid import ThumbnailGrid
+from file_scanner import is_image_name, scan_images
+
+# 色度采样下拉框中表示“不指定”的选项（由Pillow按图片模式决定）
+JPEG_SUBSAMPLING_DEFAULT = "默认"
+
 
 class ImageProcessorApp:
     def __init__(self, root):
@@ -24,17 +39,50 @@ class ImageProcessorApp:
         self.style.configure("TRadiobutton", font=("SimHei", 10))
 
         # 存储导入的图片信息
-        self.images = []  # 格式: [(原图路径, 缩略图对象, 文件名, 图片副本), ...]
+        self.images = ImageRegistry()  # 导入的图片记录（ImageRecord），按路径和编号索引，不保存完整像素
+        self.pixel_cache = PixelCache()  # 完整像素按需解码，受字节预算限制
+        self.thumbnail_cache = ThumbnailCache()  # 持久化缩略图缓存，命中时无需打开原图
+        self.import_recursive = tk.BooleanVar(value=False)  # 导入文件夹时是否包含子文件夹
+        self.import_cancel_event = None  # 正在进行的导入任务的取消标志
         self.current_preview_index = -1  # 当前预览图片索引
         self.preview_image = None  # 当前预览图片对象
         self.preview_photo = None  # 当前预览图片的PhotoImage对象
+        # 高质量预览底图缓存: (路径, 修改时间, 尺寸设置, 画布大小) -> (底图, 相对输出尺寸的缩放比例)
+        self.preview_bases = render_engine.LRUCache(maxsize=4)
+        self.preview_canvas_size = None  # 上一次 <Configure> 时的画布大小
+        self.preview_is_draft = False  # 当前预览是否为快速缩放的草图
+        self.preview_scale = 1.0  # 预览图片相对输出尺寸的缩放比例
+        self.preview_output_size = None  # 当前预览图片的输出尺寸
+        self.preview_clean = None  # 当前预览的不含水印的底图（拖拽时显示在水印图层下面）
+        self.preview_clean_photo = None
+        self.watermark_overlay = None  # 画布上单独显示的水印图层: (水印图片, PhotoImage)
+        # 预览刷新请求在事件循环空闲时合并为一次渲染
+        self.preview_scheduler = PreviewScheduler(self.root, self.update_preview)
+        # 预览在后台线程中渲染，只显示最新一次请求的结果
+        self.preview_renderer = BackgroundRenderer(self.root, self.on_preview_rendered)
+        # 连续调整水印位置/旋转时只移动水印图层，停止输入一段时间后再完整合成
+        self.settle_scheduler = PreviewScheduler(self.root, self.update_preview, delay_ms=150)
+        # 交互过程中显示快速草图，输入停止一段时间后再用LANCZOS生成高质量预览
+        self.refine_scheduler = PreviewScheduler(self.root, lambda: self.update_preview(refine=True), delay_ms=250)
 
         # 导出设置
         self.output_dir = ""
         self.naming_option = tk.StringVar(value="original")  # original, prefix, suffix
         self.custom_text = tk.StringVar(value="")
         self.output_format = tk.StringVar(value="png")
-        self.jpeg_quality = tk.IntVar(value=95)  # JPEG质量，0-100
+        self.jpeg_quality = tk.IntVar(value=95)  # JPEG/有损WebP质量，0-100
+        # 编码参数，默认值与Pillow一致
+        self.png_compress_level = tk.IntVar(value=6)  # PNG压缩级别，0-9
+        self.png_optimize = tk.BooleanVar(value=False)
+        self.jpeg_optimize = tk.BooleanVar(value=False)  # 优化霍夫曼表
+        self.jpeg_progressive = tk.BooleanVar(value=False)
+        self.jpeg_subsampling = tk.StringVar(value=JPEG_SUBSAMPLING_DEFAULT)
+        self.webp_lossless = tk.BooleanVar(value=False)
+        self.webp_method = tk.IntVar(value=4)  # WebP编码速度/压缩率权衡，0最快，6最慢
+        self.max_file_size_kb = tk.IntVar(value=0)  # JPEG/有损WebP输出大小上限（KB），0为不限制
+        self.export_workers = tk.IntVar(value=parallel_export.default_workers())  # 导出进程数，1为串行
+        self.export_cancel_event = None  # 正在进行的导出的取消标志，None表示没有导出任务
+        self.incremental_export = tk.BooleanVar(value=False)  # 增量导出：跳过原图和参数都未变化的图片
 
         # 尺寸调整设置
         self.resize_method = tk.StringVar(value="none")  # none, width, height, percentage
@@ -56,6 +104,7 @@ class ImageProcessorApp:
         # 2. 图片水印参数
         self.watermark_image_path = tk.StringVar(value="")  # 水印图片路径
         self.watermark_image_obj = None  # 加载的水印图片对象
+        self.watermark_geometry = watermark_geometry.GeometryCache()  # 水印在输出图片中的四边形（用于拖拽命中判断）
         self.watermark_image_scale = tk.IntVar(value=50)  # 图片缩放比例(0-200)
         self.watermark_image_opacity = tk.IntVar(value=50)  # 图片透明度(0-100)
         # 3. 水印位置和旋转参数
@@ -71,11 +120,13 @@ class ImageProcessorApp:
         self.watermark_templates = {}  # 存储水印模板
         self.template_dir = os.path.join(os.path.expanduser("~"), ".image_processor_templates")
         self.current_template = tk.StringVar(value="")  # 当前选中的模板
-        self.load_templates()  # 加载保存的模板
 
         # 创建界面
         self.create_widgets()
 
+        # 加载保存的模板（应用上次使用的设置时需要更新界面控件，因此在创建界面之后）
+        self.load_templates()
+
         # 尝试启用拖放功能
         self.enable_drag_and_drop()
 
@@ -115,7 +166,8 @@ class ImageProcessorApp:
         # 导入按钮
         ttk.Button(control_frame, text="导入单张图片", command=self.import_single_image).pack(fill=tk.X, pady=(0, 5))
         ttk.Button(control_frame, text="导入多张图片", command=self.import_multiple_images).pack(fill=tk.X, pady=(0, 5))
-        ttk.Button(control_frame, text="导入文件夹", command=self.import_folder).pack(fill=tk.X, pady=(0, 15))
+        ttk.Button(control_frame, text="导入文件夹", command=self.import_folder).pack(fill=tk.X, pady=(0, 5))
+        ttk.Checkbutton(control_frame, text="包含子文件夹", variable=self.import_recursive).pack(anchor=tk.W, pady=(0, 15))
 
         # 导出设置
         export_frame = ttk.LabelFrame(control_frame, text="导出设置", padding="10")
@@ -143,10 +195,12 @@ class ImageProcessorApp:
                         command=self.update_jpeg_quality_state).pack(side=tk.LEFT)
         ttk.Radiobutton(format_frame, text="PNG", variable=self.output_format, value="png",
                         command=self.update_jpeg_quality_state).pack(side=tk.LEFT, padx=10)
+        ttk.Radiobutton(format_frame, text="WebP", variable=self.output_format, value="webp",
+                        command=self.update_jpeg_quality_state).pack(side=tk.LEFT)
 
-        # JPEG质量调节
+        # JPEG/WebP质量调节
         self.jpeg_quality_frame = ttk.Frame(export_frame)
-        self.quality_label_title = ttk.Label(self.jpeg_quality_frame, text="JPEG质量:")
+        self.quality_label_title = ttk.Label(self.jpeg_quality_frame, text="质量:")
         self.quality_label_title.pack(anchor=tk.W, pady=(5, 0))
         quality_slider_frame = ttk.Frame(self.jpeg_quality_frame)
         self.quality_slider = ttk.Scale(quality_slider_frame, from_=0, to=100,
@@ -156,9 +210,57 @@ class ImageProcessorApp:
         self.quality_value_label = ttk.Label(quality_slider_frame, text=f"{self.jpeg_quality.get()}%")
         self.quality_value_label.pack(side=tk.LEFT, padx=5)
         quality_slider_frame.pack(fill=tk.X, pady=(0, 5))
-        self.jpeg_quality_frame.pack(fill=tk.X, pady=(5, 10))
+        # 大小上限：在不超过上限的前提下自动降低质量（以上面的质量为最高质量）
+        max_size_frame = ttk.Frame(self.jpeg_quality_frame)
+        self.max_size_label = ttk.Label(max_size_frame, text="最大文件大小(KB):")
+        self.max_size_label.pack(side=tk.LEFT)
+        self.max_size_spinbox = ttk.Spinbox(max_size_frame, from_=0, to=100000, increment=50,
+                                            textvariable=self.max_file_size_kb, width=7)
+        self.max_size_spinbox.pack(side=tk.LEFT, padx=5)
+        ttk.Label(max_size_frame, text="(0为不限制)").pack(side=tk.LEFT)
+        max_size_frame.pack(fill=tk.X, pady=(0, 5))
+        self.jpeg_quality_frame.pack(fill=tk.X, pady=(5, 0))
+
+        # 编码参数（只显示当前格式的选项）
+        self.encoder_frame = ttk.Frame(export_frame)
+        self.encoder_frame.pack(fill=tk.X, pady=(0, 10))
+
+        self.png_options_frame = ttk.Frame(self.encoder_frame)
+        ttk.Label(self.png_options_frame, text="压缩级别:").pack(side=tk.LEFT)
+        ttk.Spinbox(self.png_options_frame, from_=0, to=9, textvariable=self.png_compress_level,
+                    width=3).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(self.png_options_frame, text="优化", variable=self.png_optimize).pack(side=tk.LEFT)
+
+        self.jpeg_options_frame = ttk.Frame(self.encoder_frame)
+        ttk.Checkbutton(self.jpeg_options_frame, text="优化", variable=self.jpeg_optimize).pack(side=tk.LEFT)
+        ttk.Checkbutton(self.jpeg_options_frame, text="渐进式",
+                        variable=self.jpeg_progressive).pack(side=tk.LEFT, padx=5)
+        ttk.Label(self.jpeg_options_frame, text="色度采样:").pack(side=tk.LEFT)
+        ttk.Combobox(self.jpeg_options_frame, textvariable=self.jpeg_subsampling, state="readonly", width=6,
+                     values=(JPEG_SUBSAMPLING_DEFAULT,) + render_engine.JPEG_SUBSAMPLING_OPTIONS).pack(side=tk.LEFT, padx=5)
+
+        self.webp_options_frame = ttk.Frame(self.encoder_frame)
+        ttk.Checkbutton(self.webp_options_frame, text="无损", variable=self.webp_lossless,
+                        command=self.update_jpeg_quality_state).pack(side=tk.LEFT)
+        ttk.Label(self.webp_options_frame, text="压缩方法:").pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Spinbox(self.webp_options_frame, from_=0, to=6, textvariable=self.webp_method,
+                    width=3).pack(side=tk.LEFT, padx=5)
+        ttk.Label(self.webp_options_frame, text="(越大越慢越小)").pack(side=tk.LEFT)
+
         self.update_jpeg_quality_state()  # 初始状态设置
 
+        # 并行导出进程数
+        workers_frame = ttk.Frame(export_frame)
+        ttk.Label(workers_frame, text="导出进程数:").pack(side=tk.LEFT)
+        ttk.Spinbox(workers_frame, from_=1, to=64, textvariable=self.export_workers, width=5).pack(side=tk.LEFT,
+                                                                                                   padx=5)
+        ttk.Label(workers_frame, text="(1为串行)").pack(side=tk.LEFT)
+        workers_frame.pack(fill=tk.X, pady=(0, 10))
+
+        # 增量导出
+        ttk.Checkbutton(export_frame, text="增量导出（跳过未变化的图片）",
+                        variable=self.incremental_export).pack(anchor=tk.W, pady=(0, 10))
+
         # 尺寸调整设置
         resize_frame = ttk.LabelFrame(export_frame, text="尺寸调整")
         resize_frame.pack(fill=tk.X, pady=(10, 0))
@@ -335,6 +437,7 @@ class ImageProcessorApp:
             side=tk.LEFT)
         save_template_frame.pack(fill=tk.X, pady=(0, 5))
 
+        ttk.Button(control_frame, text="查看原尺寸效果", command=self.show_full_preview).pack(fill=tk.X, pady=(15, 0))
         ttk.Button(control_frame, text="导出选中图片", command=self.export_selected).pack(fill=tk.X, pady=(15, 5))
         ttk.Button(control_frame, text="导出所有图片", command=self.export_all).pack(fill=tk.X, pady=(0, 5))
 
@@ -362,18 +465,9 @@ class ImageProcessorApp:
         image_frame = ttk.LabelFrame(right_frame, text="已导入图片", padding="10")
         image_frame.pack(fill=tk.BOTH, expand=True)
 
-        # 滚动条
-        scrollbar = ttk.Scrollbar(image_frame)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-
-        # 图片列表
-        self.image_listbox = tk.Canvas(image_frame, yscrollcommand=scrollbar.set)
-        self.image_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.config(command=self.image_listbox.yview)
-
-        # 用于放置图片项的框架
-        self.images_container = ttk.Frame(self.image_listbox)
-        self.image_listbox_window = self.image_listbox.create_window((0, 0), window=self.images_container, anchor="nw")
+        # 图片列表（虚拟化网格，只为可见的行创建控件）
+        self.thumbnail_grid = ThumbnailGrid(image_frame, on_click=self.set_preview_image)
+        self.images_container = self.thumbnail_grid.canvas  # 拖放目标
 
         # 添加提示文字
         self.hint_label = ttk.Label(
@@ -382,31 +476,31 @@ class ImageProcessorApp:
             font=("SimHei", 12, "italic"),
             foreground="#666666"
         )
-        self.hint_label.pack(pady=50)
-
-        # 绑定事件以调整滚动区域
-        self.images_container.bind("<Configure>", self.on_container_configure)
-        self.image_listbox.bind("<Configure>", self.on_canvas_configure)
-
-        # 更新模板列表
-        self.update_template_list()
+        self.hint_label.place(relx=0.5, y=50, anchor=tk.N)
 
     def update_quality_label(self, value):
         """更新JPEG质量标签显示"""
         self.quality_value_label.config(text=f"{int(float(value))}%")
 
     def update_jpeg_quality_state(self):
-        """根据输出格式更新JPEG质量控件状态"""
-        state = tk.NORMAL if self.output_format.get().lower() == "jpeg" else tk.DISABLED
+        """根据输出格式更新质量控件状态，并显示该格式的编码参数"""
+        output_format = self.output_format.get().lower()
+        for fmt, frame in (("png", self.png_options_frame), ("jpeg", self.jpeg_options_frame),
+                           ("webp", self.webp_options_frame)):
+            if fmt == output_format:
+                frame.pack(fill=tk.X, pady=(5, 0))
+            else:
+                frame.pack_forget()
+
+        lossy = output_format == "jpeg" or (output_format == "webp" and not self.webp_lossless.get())
+        state = tk.NORMAL if lossy else tk.DISABLED
         # 只对支持state属性的控件设置状态
         self.quality_slider.configure(state=state)
+        self.max_size_spinbox.configure(state=state)
         # 标签通过颜色区分是否可用
-        if state == tk.DISABLED:
-            self.quality_label_title.configure(foreground="#999999")
-            self.quality_value_label.configure(foreground="#999999")
-        else:
-            self.quality_label_title.configure(foreground="#000000")
-            self.quality_value_label.configure(foreground="#000000")
+        foreground = "#999999" if state == tk.DISABLED else "#000000"
+        for label in (self.quality_label_title, self.quality_value_label, self.max_size_label):
+            label.configure(foreground=foreground)
 
     def update_resize_fields_state(self):
         """根据尺寸调整方式更新输入框状态"""
@@ -504,20 +598,19 @@ class ImageProcessorApp:
         if hasattr(self, 'hint_label') and self.hint_label.winfo_exists():
             self.hint_label.destroy()
 
-        image_paths = []
+        # 导入图片（目录在后台线程中边扫描边导入）
+        self.import_images(self.iter_dropped_images(files, self.import_recursive.get()))
+
+    def iter_dropped_images(self, files, recursive):
+        """逐个产出拖放的图片文件，目录展开为其中的图片（在导入线程中执行，不访问Tk变量）"""
         for file in files:
             # 检查是否为目录
             if os.path.isdir(file):
                 # 处理目录中的图片
-                dir_images = self.get_image_files_in_directory(file)
-                image_paths.extend(dir_images)
-            else:
+                yield from scan_images(file, recursive=recursive)
+            elif self.is_image_file(file):
                 # 检查是否为图片文件
-                if self.is_image_file(file):
-                    image_paths.append(file)
-
-        # 导入图片
-        self.import_images(image_paths)
+                yield file
 
     def update_text_entry_state(self):
         # 根据选中的命名规则更新文本输入框状态
@@ -526,29 +619,13 @@ class ImageProcessorApp:
         if state == tk.DISABLED:
             self.custom_text.set("")
 
-    def on_container_configure(self, event):
-        # 更新画布滚动区域
-        self.image_listbox.configure(scrollregion=self.image_listbox.bbox("all"))
-
-    def on_canvas_configure(self, event):
-        # 调整画布窗口大小
-        self.image_listbox.itemconfig(self.image_listbox_window, width=event.width)
-
     def is_image_file(self, file_path):
         # 检查文件是否为支持的图片格式
-        supported_formats = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.gif')
-        return file_path.lower().endswith(supported_formats)
+        return is_image_name(file_path)
 
     def get_image_files_in_directory(self, directory):
-        # 获取目录中所有支持的图片文件
-        image_extensions = ['*.jpg', '*.jpeg', '*.png', '*.bmp', '*.tiff', '*.gif']
-        image_files = []
-
-        for ext in image_extensions:
-            image_files.extend(glob.glob(os.path.join(directory, ext)))
-            image_files.extend(glob.glob(os.path.join(directory, ext.upper())))
-
-        return image_files
+        # 逐个产出目录中所有支持的图片文件（一次scandir遍历，可选包含子文件夹，带stat信息）
+        return scan_images(directory, recursive=self.import_recursive.get())
 
     def import_single_image(self):
         # 导入单张图片
@@ -599,85 +676,96 @@ class ImageProcessorApp:
             self.import_images(image_paths)
 
     def import_images(self, image_paths):
-        # 导入图片并显示
-        if not image_paths:
-            messagebox.showinfo("提示", "未找到有效的图片文件")
+        """在后台线程池中导入图片，完成的图片分批加入列表
+
+        image_paths 可以是列表，也可以是边扫描边产出的生成器
+        """
+        if self.import_cancel_event is not None:
+            messagebox.showinfo("提示", "已有导入任务正在进行")
             return
 
-        new_images = []
-        for path in image_paths:
-            # 检查是否已导入
-            if any(img[0] == path for img in self.images):
-                continue
+        total = len(image_paths) if isinstance(image_paths, (list, tuple)) else None
+        cancel_event = threading.Event()
+        progress_window, status_label, progress_bar = self.create_progress_window("正在导入", total, cancel_event)
+        self.import_cancel_event = cancel_event
+        state = {"imported": 0}
+
+        # 后台线程通过队列把每批结果传回Tk线程
+        import_queue = queue.Queue()
+        skip_paths = self.images.path_keys()
 
+        def worker():
             try:
-                # 打开图片并创建缩略图
-                with Image.open(path) as img:
-                    # 保存原图的副本，避免后续处理时文件被锁定
-                    img_copy = img.copy()
-
-                    # 创建缩略图
-                    thumbnail = img_copy.copy()
-                    thumbnail.thumbnail((120, 120))  # 缩略图最大尺寸
-                    photo = ImageTk.PhotoImage(thumbnail)
-
-                    file_name = os.path.basename(path)
-                    new_images.append((path, photo, file_name, img_copy))
+                result = image_import.run_import(
+                    image_paths, self.thumbnail_cache, skip_paths=skip_paths,
+                    on_batch=lambda batch, processed: import_queue.put(("batch", batch, processed)),
+                    cancel_event=cancel_event
+                )
             except Exception as e:
-                messagebox.showerror("错误", f"无法导入图片 {os.path.basename(path)}: {str(e)}")
-
-        if new_images:
-            self.images.extend(new_images)
+                result = image_import.ImportResult(0, [("", str(e))], False)
+            import_queue.put(("done", result))
+
+        def poll():
+            result = None
+            while True:
+                try:
+                    message = import_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if message[0] == "batch":
+                    state["imported"] += self.add_imported_images(message[1])
+                    status_label.config(text=f"已处理 {message[2]} 张" if total is None
+                                        else f"{message[2]} / {total}")
+                    if total is not None:
+                        progress_bar.config(value=message[2])
+                else:
+                    result = message[1]
+
+            if result is None:
+                self.root.after(100, poll)
+                return
+
+            progress_window.destroy()
+            self.import_cancel_event = None
+            self.show_import_summary(state["imported"], result)
+
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, poll)
+
+    def add_imported_images(self, batch):
+        """把后台导入完成的一批图片加入列表（在Tk线程中创建PhotoImage），返回新增数量"""
+        added = 0
+        for info in batch:
+            # 只保留缩略图和尺寸等信息，完整像素按需解码
+            record = ImageRecord(info.path, info.size, info.mode, info.mtime, ImageTk.PhotoImage(info.thumbnail))
+            if self.images.add(record):
+                added += 1
+        if added:
             self.update_image_list()
             # 如果是第一次导入图片，自动预览第一张
-            if self.current_preview_index == -1 and self.images:
+            if self.current_preview_index == -1:
                 self.current_preview_index = 0
-                self.update_preview()
-            messagebox.showinfo("成功", f"成功导入 {len(new_images)} 张图片")
+                self.thumbnail_grid.set_current(0)
+                self.schedule_preview()
+        return added
+
+    def show_import_summary(self, imported_count, result):
+        """汇总显示导入结果和所有无法导入的图片"""
+        if imported_count == 0 and not result.errors and not result.cancelled:
+            messagebox.showinfo("提示", "未找到有效的图片文件")
+            return
+        title = "已取消" if result.cancelled else "完成"
+        summary = f"导入{title}，成功导入 {imported_count} 张图片"
+        if result.errors:
+            summary += f"\n无法导入 {len(result.errors)} 张:\n" + self.format_errors(result.errors)
+            messagebox.showwarning(title, summary)
+        else:
+            messagebox.showinfo(title, summary)
 
     def update_image_list(self):
-        # 清空现有内容
-        for widget in self.images_container.winfo_children():
-            widget.destroy()
-
-        # 显示所有图片
-        cols = 4  # 每行显示4张图片
-        for i, (path, photo, file_name, img) in enumerate(self.images):
-            frame = ttk.Frame(self.images_container, padding="5",
-                              relief=tk.RAISED if i == self.current_preview_index else tk.FLAT, borderwidth=2)
-
-            # 点击图片切换预览
-            frame.bind("<Button-1>", lambda e, idx=i: self.set_preview_image(idx))
-
-            # 复选框
-            var = tk.BooleanVar(value=True)
-            chk = ttk.Checkbutton(frame, variable=var)
-            chk.var = var
-            chk.pack(anchor=tk.NW)
-
-            # 缩略图
-            label_img = ttk.Label(frame, image=photo)
-            label_img.image = photo  # 保持引用（避免被垃圾回收）
-            label_img.pack(pady=(0, 5))
-            label_img.bind("<Button-1>", lambda e, idx=i: self.set_preview_image(idx))
-
-            # 文件名（显示部分，过长截断）
-            display_name = file_name if len(file_name) <= 15 else file_name[:12] + "..."
-            label_name = ttk.Label(frame, text=display_name, wraplength=120)
-            label_name.pack()
-            label_name.bind("<Button-1>", lambda e, idx=i: self.set_preview_image(idx))
-
-            # 存储路径和变量引用
-            frame.image_path = path
-            frame.checkbox_var = var
-
-            # 放置在网格中
-            row, col = divmod(i, cols)
-            frame.grid(row=row, column=col, padx=5, pady=5)
-
-        # 更新滚动区域
-        self.images_container.update_idletasks()
-        self.image_listbox.configure(scrollregion=self.image_listbox.bbox("all"))
+        """图片列表变化后刷新网格（只重绘可见的单元格）"""
+        self.thumbnail_grid.current_index = self.current_preview_index
+        self.thumbnail_grid.set_items(self.images)
 
     def select_output_dir(self):
         # 选择输出文件夹
@@ -686,42 +774,84 @@ class ImageProcessorApp:
             self.output_dir = dir_path
             self.output_dir_label.config(text=os.path.basename(dir_path))
 
-    def resize_image(self, img):
-        """根据设置调整图片尺寸"""
-        method = self.resize_method.get()
-        if method == "none":
-            return img.copy()
+    def build_resize_spec(self):
+        """根据当前界面设置生成尺寸调整参数"""
+        return render_engine.ResizeSpec(
+            method=self.resize_method.get(),
+            width=self.target_width.get(),
+            height=self.target_height.get(),
+            percentage=self.resize_percentage.get()
+        )
 
-        original_width, original_height = img.size
-        new_width, new_height = original_width, original_height
+    def build_watermark_spec(self):
+        """根据当前界面设置生成水印参数"""
+        return render_engine.WatermarkSpec(
+            type=self.watermark_type.get(),
+            text=render_engine.TextWatermarkSpec(
+                text=self.watermark_text.get(),
+                font_family=self.watermark_font_family.get(),
+                font_size=self.watermark_font_size.get(),
+                bold=self.watermark_font_bold.get(),
+                italic=self.watermark_font_italic.get(),
+                color=self.watermark_text_color.get(),
+                opacity=self.watermark_text_opacity.get(),
+                shadow=self.watermark_text_shadow.get()
+            ),
+            image=render_engine.ImageWatermarkSpec(
+                path=self.watermark_image_path.get(),
+                scale=self.watermark_image_scale.get(),
+                opacity=self.watermark_image_opacity.get()
+            ),
+            x=self.watermark_x.get(),
+            y=self.watermark_y.get(),
+            rotation=self.watermark_rotation.get()
+        )
 
+    def get_spinbox_value(self, variable, name, low, high):
+        """读取数值输入框的整数，超出范围时限制在 [low, high] 内并更新输入框；无法解析时抛出 ValueError"""
         try:
-            if method == "width":
-                # 按宽度调整，保持比例
-                target_width = max(1, self.target_width.get())  # 确保至少1像素
-                ratio = target_width / original_width
-                new_width = target_width
-                new_height = int(original_height * ratio)
-
-            elif method == "height":
-                # 按高度调整，保持比例
-                target_height = max(1, self.target_height.get())  # 确保至少1像素
-                ratio = target_height / original_height
-                new_height = target_height
-                new_width = int(original_width * ratio)
-
-            elif method == "percentage":
-                # 按百分比调整
-                percentage = max(1, min(1000, self.resize_percentage.get()))  # 限制在1-1000%
-                ratio = percentage / 100
-                new_width = int(original_width * ratio)
-                new_height = int(original_height * ratio)
-
-            # 调整图片尺寸
-            return img.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        except Exception as e:
-            messagebox.showerror("错误", f"调整图片尺寸失败: {str(e)}")
-            return img.copy()
+            value = variable.get()
+        except tk.TclError:
+            raise ValueError(f"{name}必须是 {low}-{high} 之间的整数") from None
+        clamped = max(low, min(high, value))
+        if clamped != value:
+            variable.set(clamped)
+        return clamped
+
+    def build_output_spec(self):
+        """根据当前界面设置生成输出参数，输入框内容无效时抛出 ValueError"""
+        png_compress_level = self.get_spinbox_value(self.png_compress_level, "PNG压缩级别", 0, 9)
+        webp_method = self.get_spinbox_value(self.webp_method, "WebP压缩方法", 0, 6)
+        max_file_size_kb = self.get_spinbox_value(self.max_file_size_kb, "最大文件大小", 0, 100000)
+        return render_engine.OutputSpec(
+            format=self.output_format.get().lower(),
+            jpeg_quality=self.jpeg_quality.get(),
+            png_compress_level=png_compress_level,
+            png_optimize=self.png_optimize.get(),
+            jpeg_optimize=self.jpeg_optimize.get(),
+            jpeg_progressive=self.jpeg_progressive.get(),
+            jpeg_subsampling=(self.jpeg_subsampling.get()
+                              if self.jpeg_subsampling.get() in render_engine.JPEG_SUBSAMPLING_OPTIONS else None),
+            webp_quality=self.jpeg_quality.get(),
+            webp_lossless=self.webp_lossless.get(),
+            webp_method=webp_method,
+            max_bytes=max_file_size_kb * 1024
+        )
+
+    def build_render_spec(self):
+        """将当前界面设置快照为不可变的渲染参数（用于导出），输入框内容无效时抛出 ValueError"""
+        return render_engine.RenderSpec(
+            resize=self.build_resize_spec(),
+            watermark=self.build_watermark_spec(),
+            output=self.build_output_spec()
+        )
+
+    def build_preview_spec(self):
+        """预览用的渲染参数：预览不编码，不读取输出参数"""
+        return render_engine.RenderSpec(
+            resize=self.build_resize_spec(),
+            watermark=self.build_watermark_spec()
+        )
 
     # 文本水印相关方法
     def pick_text_color(self):
@@ -736,79 +866,6 @@ class ImageProcessorApp:
         slant = "italic" if self.watermark_font_italic.get() else "roman"
         return (self.watermark_font_family.get(), self.watermark_font_size.get(), weight, slant)
 
-    def add_text_watermark(self, img, is_preview=False):
-        """给图片添加文本水印（支持透明度、阴影、旋转）"""
-        img_copy = img.copy()
-        draw = ImageDraw.Draw(img_copy, mode="RGBA")
-        text = self.watermark_text.get()
-        if not text:
-            return img_copy  # 空文本不添加水印
-
-        # 1. 准备字体和颜色（带透明度）
-        try:
-            font = ImageFont.truetype(
-                font=self.watermark_font_family.get(),
-                size=self.watermark_font_size.get(),
-                weight="bold" if self.watermark_font_bold.get() else "normal"
-            )
-        except:
-            # 字体加载失败时使用默认字体
-            font = ImageFont.load_default()
-
-        # 解析颜色
-        hex_color = self.watermark_text_color.get().lstrip("#")
-        try:
-            r, g, b = tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
-        except:
-            r, g, b = 0, 0, 0  # 默认黑色
-
-        opacity = int(self.watermark_text_opacity.get() * 2.55)  # 转0-255
-        text_color = (r, g, b, opacity)
-
-        # 2. 获取文本尺寸和位置
-        img_width, img_height = img_copy.size
-        text_bbox = draw.textbbox((0, 0), text, font=font)
-        text_width = text_bbox[2] - text_bbox[0]
-        text_height = text_bbox[3] - text_bbox[1]
-
-        # 如果是预览且没有设置过位置，使用预设位置
-        if is_preview and (self.watermark_x.get() == 0 and self.watermark_y.get() == 0):
-            self.set_watermark_position()
-
-        x, y = self.watermark_x.get(), self.watermark_y.get()
-
-        # 3. 处理旋转
-        rotation = self.watermark_rotation.get()
-        if rotation != 0:
-            # 创建一个临时图像来绘制旋转后的文本
-            temp_img = Image.new('RGBA', (text_width + 20, text_height + 20), (0, 0, 0, 0))
-            temp_draw = ImageDraw.Draw(temp_img)
-
-            # 添加阴影到临时图像
-            if self.watermark_text_shadow.get():
-                shadow_color = (0, 0, 0, int(opacity * 0.3))  # 半透明黑色阴影
-                temp_draw.text((2, 2), text, font=font, fill=shadow_color)
-
-            # 添加文本到临时图像
-            temp_draw.text((0, 0), text, font=font, fill=text_color)
-
-            # 旋转临时图像
-            rotated_temp = temp_img.rotate(rotation, expand=True, resample=Image.Resampling.BILINEAR)
-
-            # 将旋转后的文本粘贴到原图
-            img_copy.paste(rotated_temp, (x, y), rotated_temp)
-        else:
-            # 不旋转的情况
-            # 添加阴影
-            if self.watermark_text_shadow.get():
-                shadow_color = (0, 0, 0, int(opacity * 0.3))  # 半透明黑色阴影
-                draw.text((x + 2, y + 2), text, font=font, fill=shadow_color)
-
-            # 添加文本水印
-            draw.text((x, y), text, font=font, fill=text_color)
-
-        return img_copy
-
     # 图片水印相关方法
     def select_watermark_image(self):
         """选择水印图片（支持PNG透明通道）"""
@@ -832,58 +889,12 @@ class ImageProcessorApp:
                     # 重置水印位置
                     self.watermark_x.set(0)
                     self.watermark_y.set(0)
-                    self.update_preview()
+                    self.schedule_preview()
             except Exception as e:
                 messagebox.showerror("错误", f"加载水印图片失败: {str(e)}")
                 self.watermark_image_path.set("")
                 self.watermark_image_obj = None
 
-    def add_image_watermark(self, img, is_preview=False):
-        """给图片添加图片水印（支持缩放、透明度、透明通道、旋转）"""
-        if not self.watermark_image_obj:
-            return img.copy()  # 无水印图片时返回原图
-
-        img_copy = img.copy()
-        watermark = self.watermark_image_obj.copy()
-
-        # 1. 缩放水印图片
-        scale = self.watermark_image_scale.get() / 100
-        wm_width = int(watermark.width * scale)
-        wm_height = int(watermark.height * scale)
-        watermark = watermark.resize((wm_width, wm_height), Image.Resampling.LANCZOS)
-
-        # 2. 调整水印透明度
-        opacity = int(self.watermark_image_opacity.get() * 2.55)  # 转0-255
-        if watermark.mode != "RGBA":
-            watermark = watermark.convert("RGBA")
-        wm_data = watermark.getdata()
-        # 遍历每个像素调整透明度
-        new_wm_data = [(r, g, b, int(a * opacity / 255)) for r, g, b, a in wm_data]
-        watermark.putdata(new_wm_data)
-
-        # 3. 处理旋转
-        rotation = self.watermark_rotation.get()
-        if rotation != 0:
-            watermark = watermark.rotate(rotation, expand=True, resample=Image.Resampling.BILINEAR)
-
-        # 4. 获取水印尺寸和位置
-        wm_width, wm_height = watermark.size
-        img_width, img_height = img_copy.size
-
-        # 如果是预览且没有设置过位置，使用预设位置
-        if is_preview and (self.watermark_x.get() == 0 and self.watermark_y.get() == 0):
-            self.set_watermark_position()
-
-        x, y = self.watermark_x.get(), self.watermark_y.get()
-
-        # 确保水印不会超出图片范围太多
-        x = max(0, min(x, img_width - 10))
-        y = max(0, min(y, img_height - 10))
-
-        # 5. 叠加水印（保留PNG透明通道）
-        img_copy.paste(watermark, (x, y), watermark)  # 第三个参数是蒙版，保留透明
-        return img_copy
-
     def update_watermark_fields(self):
         """根据水印类型显示/隐藏对应设置项"""
         watermark_type = self.watermark_type.get()
@@ -901,7 +912,7 @@ class ImageProcessorApp:
             self.image_watermark_subframe.pack_forget()
 
         # 更新预览
-        self.update_preview()
+        self.schedule_preview()
 
     def get_output_path(self, original_path):
         # 根据设置生成输出路径
@@ -911,8 +922,7 @@ class ImageProcessorApp:
         # 检查是否为原文件夹（防止覆盖）
         original_dir = os.path.dirname(original_path)
         if os.path.abspath(self.output_dir) == os.path.abspath(original_dir):
-            messagebox.showerror("错误", "禁止导出到原文件夹，以防止覆盖原图")
-            return None
+            raise ValueError("禁止导出到原文件夹，以防止覆盖原图")
 
         # 获取文件名和扩展名
         file_name = os.path.basename(original_path)
@@ -966,48 +976,138 @@ class ImageProcessorApp:
             return
 
         # 获取选中的图片
-        selected_frames = [frame for frame in self.images_container.winfo_children()
-                           if hasattr(frame, 'checkbox_var') and frame.checkbox_var.get()]
+        selected_records = [self.images[i] for i in self.thumbnail_grid.selected_indices()]
 
-        if not selected_frames:
+        if not selected_records:
             messagebox.showinfo("提示", "请先选择要导出的图片")
             return
 
-        # 导出图片
-        success_count = 0
-        for frame in selected_frames:
-            # 找到对应的图片数据
-            for path, photo, file_name, img in self.images:
-                if path == frame.image_path:
-                    output_path = self.get_output_path(path)
-                    if output_path:
-                        try:
-                            # 1. 先调整尺寸
-                            resized_img = self.resize_image(img)
-                            # 2. 根据水印类型添加水印
-                            watermark_type = self.watermark_type.get()
-                            if watermark_type == "text":
-                                final_img = self.add_text_watermark(resized_img)
-                            elif watermark_type == "image":
-                                final_img = self.add_image_watermark(resized_img)
-                            else:
-                                final_img = resized_img  # 无水印
-
-                            # 3. 保存图片
-                            if self.output_format.get().lower() == "jpeg":
-                                if final_img.mode in ('RGBA', 'LA'):
-                                    background = Image.new(final_img.mode[:-1], final_img.size, (255, 255, 255))
-                                    background.paste(final_img, final_img.split()[-1])
-                                    final_img = background
-                                final_img.save(output_path, "JPEG", quality=self.jpeg_quality.get())
-                            else:  # PNG（保留透明通道）
-                                final_img.save(output_path, "PNG")
-                            success_count += 1
-                        except Exception as e:
-                            messagebox.showerror("错误", f"导出 {file_name} 失败: {str(e)}")
-                    break
+        # 生成导出任务（渲染参数在导出开始时快照一次）
+        try:
+            spec = self.build_render_spec()
+        except ValueError as e:
+            messagebox.showerror("错误", str(e))
+            return
+        tasks = []
+        errors = []
+        for record in selected_records:
+            try:
+                output_path = self.get_output_path(record.path)
+            except ValueError as e:
+                errors.append((record.path, str(e)))
+                continue
+            tasks.append(parallel_export.ExportTask(record.path, output_path, spec))
+
+        self.start_export(tasks, errors)
+
+    def start_export(self, tasks, errors):
+        """在后台线程中执行导出，并显示进度窗口"""
+        if self.export_cancel_event is not None:
+            messagebox.showinfo("提示", "已有导出任务正在进行")
+            return
+
+        try:
+            workers = max(1, self.export_workers.get())
+        except tk.TclError:
+            workers = 1
+        incremental = self.incremental_export.get()
 
-        messagebox.showinfo("完成", f"导出完成，成功导出 {success_count} 张图片")
+        cancel_event = threading.Event()
+        progress_window, status_label, progress_bar = self.create_progress_window("正在导出", len(tasks), cancel_event)
+        self.export_cancel_event = cancel_event
+
+        # 后台线程通过队列把进度传回Tk线程
+        progress_queue = queue.Queue()
+
+        def worker():
+            try:
+                result = parallel_export.run_export(
+                    tasks, workers,
+                    on_progress=lambda done, total, task, error: progress_queue.put(("progress", done, total)),
+                    cancel_event=cancel_event,
+                    incremental=incremental
+                )
+            except Exception as e:
+                result = parallel_export.ExportResult(0, [("", str(e))], False)
+            progress_queue.put(("done", result))
+
+        def poll():
+            result = None
+            while True:
+                try:
+                    message = progress_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if message[0] == "progress":
+                    done, total = message[1], message[2]
+                    progress_bar.config(value=done, maximum=max(1, total))
+                    status_label.config(text=f"{done} / {total}")
+                else:
+                    result = message[1]
+
+            if result is None:
+                self.root.after(100, poll)
+                return
+
+            progress_window.destroy()
+            self.export_cancel_event = None
+            self.show_export_summary(result, errors)
+
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, poll)
+
+    def create_progress_window(self, title, total, cancel_event):
+        """创建带取消按钮的进度窗口，total 为None时显示不确定进度，返回 (窗口, 状态标签, 进度条)"""
+        progress_window = tk.Toplevel(self.root)
+        progress_window.title(title)
+        progress_window.transient(self.root)
+        progress_window.resizable(False, False)
+        status_label = ttk.Label(progress_window, text="正在扫描..." if total is None else f"0 / {total}")
+        status_label.pack(padx=20, pady=(15, 5))
+        if total is None:
+            progress_bar = ttk.Progressbar(progress_window, length=300, mode="indeterminate")
+            progress_bar.start(15)
+        else:
+            progress_bar = ttk.Progressbar(progress_window, length=300, maximum=max(1, total))
+        progress_bar.pack(padx=20, pady=5)
+        cancel_button = ttk.Button(progress_window, text="取消",
+                                   command=lambda: (cancel_event.set(), cancel_button.config(state=tk.DISABLED)))
+        cancel_button.pack(pady=(5, 15))
+        progress_window.protocol("WM_DELETE_WINDOW", cancel_event.set)
+        return progress_window, status_label, progress_bar
+
+    def format_errors(self, errors, max_lines=10):
+        """把 [(路径, 错误信息)] 格式化为多行文本，过多时省略"""
+        lines = [f"{os.path.basename(path)}: {error}" for path, error in errors[:max_lines]]
+        if len(errors) > max_lines:
+            lines.append(f"... 其余 {len(errors) - max_lines} 项省略")
+        return "\n".join(lines)
+
+    def show_export_summary(self, result, errors):
+        """汇总显示导出结果和所有失败的图片"""
+        all_errors = errors + result.errors
+        title = "已取消" if result.cancelled else "完成"
+        summary = f"导出{title}，成功导出 {result.success_count} 张图片"
+        if result.skipped_count:
+            summary += f"，跳过 {result.skipped_count} 张未变化的图片"
+        if result.stats is not None and result.success_count:
+            # 各阶段利用率：读取/写入接近100%说明受限于磁盘，处理接近100%说明受限于CPU
+            usage = parallel_export.stage_utilization(result.stats)
+            summary += (f"\n用时 {result.stats.wall_time:.1f} 秒，阶段利用率: 读取 {usage['read']:.0%}，"
+                        f"处理 {usage['cpu']:.0%}，写入 {usage['write']:.0%}")
+        if result.image_stats:
+            # 每张图片的编码耗时和输出大小，用于比较不同编码参数
+            encode_times = [item.encode_time for item in result.image_stats]
+            total_bytes = sum(item.output_bytes for item in result.image_stats)
+            summary += (f"\n编码耗时: 平均 {sum(encode_times) / len(encode_times) * 1000:.0f} 毫秒，"
+                        f"最长 {max(encode_times) * 1000:.0f} 毫秒；"
+                        f"输出大小: 平均 {total_bytes / len(encode_times) / 1024:.1f} KB，"
+                        f"合计 {total_bytes / 1024 / 1024:.2f} MB")
+        if all_errors:
+            summary += f"\n失败 {len(all_errors)} 张:\n" + self.format_errors(all_errors)
+            messagebox.showwarning(title, summary)
+        else:
+            messagebox.showinfo(title, summary)
 
     def export_all(self):
         # 导出所有图片（全选后调用导出选中逻辑）
@@ -1016,9 +1116,7 @@ class ImageProcessorApp:
             return
 
         # 全选所有图片
-        for frame in self.images_container.winfo_children():
-            if hasattr(frame, 'checkbox_var'):
-                frame.checkbox_var.set(True)
+        self.thumbnail_grid.select_all()
 
         # 调用导出选中图片的函数
         self.export_selected()
@@ -1027,60 +1125,112 @@ class ImageProcessorApp:
     def bind_watermark_events(self):
         """绑定水印设置变更事件，实现实时预览"""
         # 水印类型变更
-        self.watermark_type.trace_add("write", lambda *args: self.update_preview())
+        self.watermark_type.trace_add("write", lambda *args: self.schedule_preview())
 
         # 文本水印变更
-        self.watermark_text.trace_add("write", lambda *args: self.update_preview())
-        self.watermark_font_family.trace_add("write", lambda *args: self.update_preview())
-        self.watermark_font_size.trace_add("write", lambda *args: self.update_preview())
-        self.watermark_font_bold.trace_add("write", lambda *args: self.update_preview())
-        self.watermark_font_italic.trace_add("write", lambda *args: self.update_preview())
-        self.watermark_text_color.trace_add("write", lambda *args: self.update_preview())
-        self.watermark_text_opacity.trace_add("write", lambda *args: self.update_preview())
-        self.watermark_text_shadow.trace_add("write", lambda *args: self.update_preview())
+        self.watermark_text.trace_add("write", lambda *args: self.schedule_preview())
+        self.watermark_font_family.trace_add("write", lambda *args: self.schedule_preview())
+        self.watermark_font_size.trace_add("write", lambda *args: self.schedule_preview())
+        self.watermark_font_bold.trace_add("write", lambda *args: self.schedule_preview())
+        self.watermark_font_italic.trace_add("write", lambda *args: self.schedule_preview())
+        self.watermark_text_color.trace_add("write", lambda *args: self.schedule_preview())
+        self.watermark_text_opacity.trace_add("write", lambda *args: self.schedule_preview())
+        self.watermark_text_shadow.trace_add("write", lambda *args: self.schedule_preview())
 
         # 图片水印变更
-        self.watermark_image_scale.trace_add("write", lambda *args: self.update_preview())
-        self.watermark_image_opacity.trace_add("write", lambda *args: self.update_preview())
+        self.watermark_image_scale.trace_add("write", lambda *args: self.schedule_preview())
+        self.watermark_image_opacity.trace_add("write", lambda *args: self.schedule_preview())
 
         # 水印位置和旋转变更
         self.watermark_position.trace_add("write", lambda *args: self.set_watermark_position())
-        self.watermark_rotation.trace_add("write", lambda *args: self.update_preview())
+        self.watermark_rotation.trace_add("write", lambda *args: self.preview_watermark_changed())
 
         # 尺寸调整变更
-        self.resize_method.trace_add("write", lambda *args: self.update_preview())
-        self.target_width.trace_add("write", lambda *args: self.update_preview())
-        self.target_height.trace_add("write", lambda *args: self.update_preview())
-        self.resize_percentage.trace_add("write", lambda *args: self.update_preview())
+        self.resize_method.trace_add("write", lambda *args: self.schedule_preview())
+        self.target_width.trace_add("write", lambda *args: self.schedule_preview())
+        self.target_height.trace_add("write", lambda *args: self.schedule_preview())
+        self.resize_percentage.trace_add("write", lambda *args: self.schedule_preview())
 
     def set_preview_image(self, index):
         """设置当前预览图片"""
         if 0 <= index < len(self.images):
             self.current_preview_index = index
-            self.update_image_list()  # 更新列表高亮显示
-            self.update_preview()  # 更新预览
+            self.thumbnail_grid.set_current(index)  # 更新列表高亮显示
+            self.schedule_preview()  # 更新预览
+
+    def get_preview_canvas_size(self):
+        """获取预览画布尺寸"""
+        canvas_width = self.preview_canvas.winfo_width()
+        canvas_height = self.preview_canvas.winfo_height()
 
-    def update_preview(self):
-        """更新预览窗口显示"""
+        # 如果画布还没渲染，使用默认尺寸
+        if canvas_width <= 1 or canvas_height <= 1:
+            canvas_width = 800
+            canvas_height = 600
+        return canvas_width, canvas_height
+
+    def get_preview_base(self, record, resize_spec, canvas_size, allow_draft=False):
+        """获取画布尺寸的预览底图，返回 (底图, 缩放比例, 是否为草图)（只在预览渲染线程中调用）
+
+        高质量底图按 (图片, 尺寸设置, 画布大小) 缓存，相同的画布大小不会重复缩放；
+        尚未缓存且 allow_draft 为True时只用快速缩放生成草图
+        """
+        key = (record.path, record.mtime, resize_spec, canvas_size)
+        cached = self.preview_bases.get(key)
+        if cached is not None:
+            return cached + (False,)
+        img = self.pixel_cache.get(record)
+        if allow_draft:
+            return render_engine.make_proxy(img, resize_spec, canvas_size, fast=True) + (True,)
+        result = render_engine.make_proxy(img, resize_spec, canvas_size)
+        self.preview_bases.put(key, result)
+        return result + (False,)
+
+    def schedule_preview(self):
+        """请求刷新预览（同一轮事件循环内的多次请求只渲染一次）"""
+        self.preview_scheduler.request()
+
+    def update_preview(self, refine=False):
+        """更新预览窗口显示（在画布尺寸的低分辨率底图上合成水印）
+
+        底图尚未缓存时先显示快速草图，refine=True 时生成高质量底图
+        """
         if self.current_preview_index < 0 or self.current_preview_index >= len(self.images):
             return
+        record = self.images[self.current_preview_index]
+
+        # 如果没有设置过位置，使用预设位置
+        if self.watermark_type.get() != "none" and self.watermark_x.get() == 0 and self.watermark_y.get() == 0:
+            self.apply_preset_position()
+
+        # 在Tk线程中快照所有设置，后台线程不访问Tk变量
+        spec = self.build_preview_spec()
+        canvas_size = self.get_preview_canvas_size()
+        watermark_image = self.watermark_image_obj
+        output_size = render_engine.compute_resized_size(record.size, spec.resize)
+        # 参数变化时顺便更新水印几何，拖拽开始时的命中判断直接使用
+        self.watermark_geometry.get(spec.watermark, output_size, watermark_image)
+
+        def render():
+            base, scale, draft = self.get_preview_base(record, spec.resize, canvas_size, allow_draft=not refine)
+            # 水印坐标、字号、缩放比例按底图比例换算
+            preview_image = render_engine.render_proxy(base, scale, spec.watermark, watermark_image)
+            return preview_image, base, scale, output_size, draft
+
+        self.preview_renderer.submit(render)
+
+    def on_preview_rendered(self, result, error):
+        """后台渲染完成（在Tk线程中调用）"""
+        if error is not None:
+            messagebox.showerror("错误", f"生成预览失败: {str(error)}")
+            return
 
-        # 获取当前图片
-        path, photo, file_name, img = self.images[self.current_preview_index]
-
-        # 调整尺寸
-        resized_img = self.resize_image(img)
-
-        # 添加水印
-        watermark_type = self.watermark_type.get()
-        if watermark_type == "text":
-            self.preview_image = self.add_text_watermark(resized_img, is_preview=True)
-        elif watermark_type == "image":
-            self.preview_image = self.add_image_watermark(resized_img, is_preview=True)
-        else:
-            self.preview_image = resized_img
-
-        # 调整预览大小以适应窗口
+        (self.preview_image, self.preview_clean, self.preview_scale, self.preview_output_size,
+         self.preview_is_draft) = result
+        if self.preview_is_draft:
+            # 输入停止后再生成高质量预览（期间的新请求会重新计时）
+            self.refine_scheduler.request()
+        # 在画布上显示
         self.display_preview_image()
 
     def display_preview_image(self):
@@ -1090,110 +1240,151 @@ class ImageProcessorApp:
 
         # 清除画布
         self.preview_canvas.delete("all")
+        canvas_width, canvas_height = self.get_preview_canvas_size()
 
-        # 获取画布尺寸
-        canvas_width = self.preview_canvas.winfo_width()
-        canvas_height = self.preview_canvas.winfo_height()
-
-        # 如果画布还没渲染，使用默认尺寸
-        if canvas_width <= 1 or canvas_height <= 1:
-            canvas_width = 800
-            canvas_height = 600
-
-        # 计算缩放比例以适应画布
+        # 预览图片按画布尺寸生成，画布变小时再缩小一次
         img_width, img_height = self.preview_image.size
-        scale = min(canvas_width / img_width, canvas_height / img_height, 1.0)
-
-        # 计算缩放后的尺寸
-        new_width = int(img_width * scale)
-        new_height = int(img_height * scale)
-
-        # 缩放图片
-        scaled_img = self.preview_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        fit_scale = render_engine.compute_fit_scale((img_width, img_height), (canvas_width, canvas_height))
+        new_width = max(1, int(img_width * fit_scale))
+        new_height = max(1, int(img_height * fit_scale))
+        scaled_img = self.preview_image
+        if fit_scale < 1.0:
+            if self.preview_is_draft:
+                scaled_img = self.preview_image.resize((new_width, new_height), Image.Resampling.BILINEAR)
+            else:
+                scaled_img = downscale(self.preview_image, (new_width, new_height))
         self.preview_photo = ImageTk.PhotoImage(scaled_img)
 
         # 计算居中位置
         x = (canvas_width - new_width) // 2
         y = (canvas_height - new_height) // 2
 
-        # 在画布上显示图片
-        self.preview_canvas.create_image(x, y, anchor=tk.NW, image=self.preview_photo)
+        # 在画布上显示图片（水印图层清空，拖拽中时重新叠加）
+        self.preview_canvas.create_image(x, y, anchor=tk.NW, image=self.preview_photo, tags="preview_image")
+        self.preview_clean_photo = None
+        self.watermark_overlay = None
 
-        # 存储预览信息
+        # 存储预览信息（坐标换算以输出尺寸为准）
         self.preview_info = {
-            "original_size": (img_width, img_height),
+            "original_size": self.preview_output_size,
             "scaled_size": (new_width, new_height),
-            "scale": scale,
+            "scale": self.preview_scale * fit_scale,
             "position": (x, y)
         }
 
-        # 绑定画布大小变化事件
-        self.preview_canvas.bind("<Configure>", lambda e: self.display_preview_image())
+        # 绑定画布大小变化事件（按新尺寸重新生成底图）
+        self.preview_canvas.bind("<Configure>", self.on_preview_canvas_configure)
+
+        if self.is_dragging:
+            self.update_watermark_overlay()
+
+    def on_preview_canvas_configure(self, event):
+        """画布大小变化时刷新预览，大小未变的 <Configure> 事件直接忽略"""
+        size = (event.width, event.height)
+        if size != self.preview_canvas_size:
+            self.preview_canvas_size = size
+            self.schedule_preview()
+
+    def update_watermark_overlay(self):
+        """把水印作为单独的画布图层显示在不含水印的底图上，返回是否成功显示
+
+        拖拽、切换预设位置和旋转时只移动或替换这个小图层，不重新合成整张预览
+        """
+        if self.preview_image is None or self.preview_clean is None or not hasattr(self, 'preview_info'):
+            return False
+        info = self.preview_info
+        canvas = self.preview_canvas
+
+        # 底图换成不含水印的版本（每次预览只生成一次）
+        if self.preview_clean_photo is None:
+            clean = self.preview_clean
+            if clean.size != info["scaled_size"]:
+                clean = clean.resize(info["scaled_size"], Image.Resampling.BILINEAR)
+            self.preview_clean_photo = ImageTk.PhotoImage(clean)
+            canvas.itemconfigure("preview_image", image=self.preview_clean_photo)
+
+        # 按预览比例生成水印图片（结果有缓存），计算其在画布上的位置
+        spec = render_engine.scale_watermark_spec(self.build_watermark_spec(), info["scale"])
+        sprite, position = render_engine.watermark_sprite(spec, info["scaled_size"], self.watermark_image_obj)
+        if sprite is None:
+            canvas.delete("watermark_overlay")
+            self.watermark_overlay = None
+            return True
+
+        # 水印外观变化时才重新创建PhotoImage，单纯移动只修改坐标
+        if self.watermark_overlay is None or self.watermark_overlay[0] is not sprite:
+            photo = ImageTk.PhotoImage(sprite)
+            canvas.delete("watermark_overlay")
+            canvas.create_image(0, 0, anchor=tk.NW, image=photo, tags="watermark_overlay")
+            self.watermark_overlay = (sprite, photo)
+        offset_x, offset_y = info["position"]
+        canvas.coords("watermark_overlay", offset_x + position[0], offset_y + position[1])
+        return True
+
+    def preview_watermark_changed(self):
+        """水印位置或旋转变化：立即更新水印图层，输入停止后再完整合成预览"""
+        if self.update_watermark_overlay():
+            self.settle_scheduler.request()
+        else:
+            self.schedule_preview()
 
-    def set_watermark_position(self):
-        """根据九宫格位置设置水印位置"""
+    def show_full_preview(self):
+        """按输出尺寸完整渲染当前图片，在新窗口中查看"""
         if self.current_preview_index < 0 or self.current_preview_index >= len(self.images):
+            messagebox.showinfo("提示", "请先导入并选择图片")
             return
 
-        # 获取当前图片
-        path, photo, file_name, img = self.images[self.current_preview_index]
-        resized_img = self.resize_image(img)
-        img_width, img_height = resized_img.size
-
-        # 获取水印尺寸
-        if self.watermark_type.get() == "text":
-            # 计算文本水印尺寸
-            try:
-                font = ImageFont.truetype(
-                    font=self.watermark_font_family.get(),
-                    size=self.watermark_font_size.get(),
-                    weight="bold" if self.watermark_font_bold.get() else "normal"
-                )
-            except:
-                font = ImageFont.load_default()
-
-            draw = ImageDraw.Draw(resized_img)
-            text = self.watermark_text.get() or " "  # 防止空文本
-            text_bbox = draw.textbbox((0, 0), text, font=font)
-            wm_width = text_bbox[2] - text_bbox[0]
-            wm_height = text_bbox[3] - text_bbox[1]
-        elif self.watermark_type.get() == "image" and self.watermark_image_obj:
-            # 计算图片水印尺寸
-            scale = self.watermark_image_scale.get() / 100
-            wm_width = int(self.watermark_image_obj.width * scale)
-            wm_height = int(self.watermark_image_obj.height * scale)
-        else:
+        try:
+            img = self.pixel_cache.get(self.images[self.current_preview_index])
+            full_img = render_engine.render_image(img, self.build_preview_spec(), self.watermark_image_obj)
+        except Exception as e:
+            messagebox.showerror("错误", f"生成预览失败: {str(e)}")
             return
 
-        # 根据选择的位置计算坐标
-        position = self.watermark_position.get()
-        margin = 20  # 边距
-
-        if position == "top_left":
-            x, y = margin, margin
-        elif position == "top_center":
-            x, y = (img_width - wm_width) // 2, margin
-        elif position == "top_right":
-            x, y = img_width - wm_width - margin, margin
-        elif position == "middle_left":
-            x, y = margin, (img_height - wm_height) // 2
-        elif position == "center":
-            x, y = (img_width - wm_width) // 2, (img_height - wm_height) // 2
-        elif position == "middle_right":
-            x, y = img_width - wm_width - margin, (img_height - wm_height) // 2
-        elif position == "bottom_left":
-            x, y = margin, img_height - wm_height - margin
-        elif position == "bottom_center":
-            x, y = (img_width - wm_width) // 2, img_height - wm_height - margin
-        else:  # bottom_right
-            x, y = img_width - wm_width - margin, img_height - wm_height - margin
+        window = tk.Toplevel(self.root)
+        window.title(f"原尺寸效果 - {full_img.width}x{full_img.height}")
+        window.geometry("1000x700")
+        x_scrollbar = ttk.Scrollbar(window, orient=tk.HORIZONTAL)
+        x_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
+        y_scrollbar = ttk.Scrollbar(window, orient=tk.VERTICAL)
+        y_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        canvas = tk.Canvas(window, xscrollcommand=x_scrollbar.set, yscrollcommand=y_scrollbar.set)
+        canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        x_scrollbar.config(command=canvas.xview)
+        y_scrollbar.config(command=canvas.yview)
+
+        photo = ImageTk.PhotoImage(full_img)
+        canvas.create_image(0, 0, anchor=tk.NW, image=photo)
+        canvas.image = photo  # 保持引用（避免被垃圾回收）
+        canvas.configure(scrollregion=(0, 0, full_img.width, full_img.height))
+
+    def apply_preset_position(self):
+        """根据九宫格位置计算水印坐标（不刷新预览），成功时返回True"""
+        if self.current_preview_index < 0 or self.current_preview_index >= len(self.images):
+            return False
+
+        # 获取当前图片调整后的尺寸
+        record = self.images[self.current_preview_index]
+        img_size = render_engine.compute_resized_size(record.size, self.build_resize_spec())
+
+        # 获取水印尺寸
+        if self.watermark_type.get() == "image" and not self.watermark_image_obj:
+            return False
+        wm_size = render_engine.measure_watermark(self.build_watermark_spec(), self.watermark_image_obj)
+        if wm_size is None:
+            return False
 
         # 更新水印位置
+        x, y = render_engine.compute_preset_position(img_size, wm_size, self.watermark_position.get())
         self.watermark_x.set(x)
         self.watermark_y.set(y)
+        return True
 
-        # 更新预览
-        self.update_preview()
+    def set_watermark_position(self):
+        """根据九宫格位置设置水印位置"""
+        if self.apply_preset_position():
+            # 更新预览
+            self.preview_watermark_changed()
 
     def start_drag_watermark(self, event):
         """开始拖拽水印"""
@@ -1218,6 +1409,8 @@ class ImageProcessorApp:
             # 计算偏移量
             self.drag_offset_x = click_x - self.watermark_x.get()
             self.drag_offset_y = click_y - self.watermark_y.get()
+            # 拖拽过程中水印作为单独的图层移动
+            self.update_watermark_overlay()
 
     def drag_watermark(self, event):
         """拖拽水印过程"""
@@ -1240,63 +1433,21 @@ class ImageProcessorApp:
         self.watermark_x.set(int(new_x))
         self.watermark_y.set(int(new_y))
 
-        # 更新预览
-        self.update_preview()
+        # 只移动水印图层，不重新合成预览
+        if not self.update_watermark_overlay():
+            self.schedule_preview()
 
     def stop_drag_watermark(self, event):
-        """停止拖拽水印"""
-        self.is_dragging = False
+        """停止拖拽水印，按最终位置完整合成预览"""
+        if self.is_dragging:
+            self.is_dragging = False
+            self.schedule_preview()
 
     def is_point_on_watermark(self, x, y, img_width, img_height):
-        """判断点是否在水印上"""
-        wm_x, wm_y = self.watermark_x.get(), self.watermark_y.get()
-
-        # 获取水印尺寸
-        if self.watermark_type.get() == "text":
-            try:
-                font = ImageFont.truetype(
-                    font=self.watermark_font_family.get(),
-                    size=self.watermark_font_size.get(),
-                    weight="bold" if self.watermark_font_bold.get() else "normal"
-                )
-            except:
-                font = ImageFont.load_default()
-
-            text = self.watermark_text.get() or " "  # 防止空文本
-            temp_img = Image.new('RGBA', (img_width, img_height), (0, 0, 0, 0))
-            draw = ImageDraw.Draw(temp_img)
-            text_bbox = draw.textbbox((wm_x, wm_y), text, font=font)
-            return (text_bbox[0] <= x <= text_bbox[2] and
-                    text_bbox[1] <= y <= text_bbox[3])
-
-        elif self.watermark_type.get() == "image" and self.watermark_image_obj:
-            scale = self.watermark_image_scale.get() / 100
-            wm_width = int(self.watermark_image_obj.width * scale)
-            wm_height = int(self.watermark_image_obj.height * scale)
-
-            # 考虑旋转的情况
-            rotation = self.watermark_rotation.get()
-            if rotation != 0:
-                # 简化处理，使用旋转后的外接矩形判断
-                angle_rad = math.radians(rotation)
-                cos_theta = abs(math.cos(angle_rad))
-                sin_theta = abs(math.sin(angle_rad))
-                rotated_width = int(wm_width * cos_theta + wm_height * sin_theta)
-                rotated_height = int(wm_width * sin_theta + wm_height * cos_theta)
-
-                # 计算旋转后水印的中心位置
-                center_x = wm_x + wm_width / 2
-                center_y = wm_y + wm_height / 2
-
-                # 判断点是否在旋转后的外接矩形内
-                return (center_x - rotated_width / 2 <= x <= center_x + rotated_width / 2 and
-                        center_y - rotated_height / 2 <= y <= center_y + rotated_height / 2)
-            else:
-                # 不旋转的情况
-                return (wm_x <= x <= wm_x + wm_width and
-                        wm_y <= y <= wm_y + wm_height)
-
-        return False
+        """判断点是否在水印上（使用缓存的水印四边形，参数未变化时不重新计算）"""
+        geometry = self.watermark_geometry.get(self.build_watermark_spec(), (img_width, img_height),
+                                               self.watermark_image_obj)
+        return geometry is not None and watermark_geometry.contains(geometry, x, y)
 
     # 水印模板管理相关方法
     def load_templates(self):
@@ -1323,6 +1474,9 @@ class ImageProcessorApp:
         except Exception as e:
             print(f"加载模板失败: {e}")
 
+        # 更新模板列表
+        self.update_template_list()
+
     def update_template_list(self):
         """更新模板下拉列表"""
         self.template_combobox['values'] = list(self.watermark_templates.keys())
@@ -1356,7 +1510,19 @@ class ImageProcessorApp:
 
             # 布局设置
             "watermark_position": self.watermark_position.get(),
-            "watermark_rotation": self.watermark_rotation.get()
+            "watermark_rotation": self.watermark_rotation.get(),
+
+            # 输出格式与编码参数
+            "output_format": self.output_format.get(),
+            "output_quality": self.jpeg_quality.get(),
+            "png_compress_level": self.png_compress_level.get(),
+            "png_optimize": self.png_optimize.get(),
+            "jpeg_optimize": self.jpeg_optimize.get(),
+            "jpeg_progressive": self.jpeg_progressive.get(),
+            "jpeg_subsampling": self.jpeg_subsampling.get(),
+            "webp_lossless": self.webp_lossless.get(),
+            "webp_method": self.webp_method.get(),
+            "max_file_size_kb": self.max_file_size_kb.get()
         }
 
         # 保存模板
@@ -1441,7 +1607,31 @@ class ImageProcessorApp:
         # 应用图片水印设置
         img_path = settings.get("watermark_image_path", "")
         self.watermark_image_path.set(img_path)
-        # 尝试加载图片
+        self.watermark_image_scale.set(settings.get("watermark_image_scale", 50))
+        self.watermark_image_opacity.set(settings.get("watermark_image_opacity", 50))
+
+        # 应用布局设置
+        self.watermark_position.set(settings.get("watermark_position", "bottom_right"))
+        self.watermark_rotation.set(settings.get("watermark_rotation", 0))
+
+        # 应用输出格式与编码参数（旧模板没有这些项，保持当前设置）
+        self.output_format.set(settings.get("output_format", self.output_format.get()))
+        self.jpeg_quality.set(settings.get("output_quality", self.jpeg_quality.get()))
+        self.png_compress_level.set(settings.get("png_compress_level", self.png_compress_level.get()))
+        self.png_optimize.set(settings.get("png_optimize", self.png_optimize.get()))
+        self.jpeg_optimize.set(settings.get("jpeg_optimize", self.jpeg_optimize.get()))
+        self.jpeg_progressive.set(settings.get("jpeg_progressive", self.jpeg_progressive.get()))
+        self.jpeg_subsampling.set(settings.get("jpeg_subsampling", self.jpeg_subsampling.get()))
+        self.webp_lossless.set(settings.get("webp_lossless", self.webp_lossless.get()))
+        self.webp_method.set(settings.get("webp_method", self.webp_method.get()))
+        self.max_file_size_kb.set(settings.get("max_file_size_kb", self.max_file_size_kb.get()))
+
+        # 重置水印位置（会根据预设位置重新计算）
+        self.watermark_x.set(0)
+        self.watermark_y.set(0)
+
+        # 所有变量设置完成后再更新界面控件，控件更新失败不影响已应用的设置
+        # 尝试加载水印图片
         if img_path and os.path.exists(img_path):
             try:
                 with Image.open(img_path) as img:
@@ -1454,23 +1644,14 @@ class ImageProcessorApp:
                     self.watermark_preview_label.image = preview_photo
             except:
                 pass
-
-        self.watermark_image_scale.set(settings.get("watermark_image_scale", 50))
-        self.watermark_image_opacity.set(settings.get("watermark_image_opacity", 50))
-
-        # 应用布局设置
-        self.watermark_position.set(settings.get("watermark_position", "bottom_right"))
-        self.watermark_rotation.set(settings.get("watermark_rotation", 0))
+        self.update_quality_label(self.jpeg_quality.get())
+        self.update_jpeg_quality_state()
 
         # 更新水印字段显示状态
         self.update_watermark_fields()
 
-        # 重置水印位置（会根据预设位置重新计算）
-        self.watermark_x.set(0)
-        self.watermark_y.set(0)
-
         # 更新预览
-        self.update_preview()
+        self.schedule_preview()
 
     def save_last_used_settings(self, settings):
         """保存上次使用的设置"""
@@ -1483,6 +1664,9 @@ class ImageProcessorApp:
 
 
 if __name__ == "__main__":
+    # 打包为exe后，子进程需要此调用才能正常启动
+    multiprocessing.freeze_support()
+
     # 检查是否已安装tkinterdnd2，如果已安装则使用其Tk类
     try:
         from tkinterdnd2 import Tk
@@ -0,0 +1,159 @@
+"""
+导入图片的存储
+
+ImageRecord 只保存路径、尺寸、模式、修改时间和缩略图等少量信息，
+完整像素通过 PixelCache 按需解码，并受总字节数限制（LRU淘汰）。
+ImageRegistry 按导入顺序保存记录，并按规范化路径和编号建立索引，查重和查找都是O(1)。
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from image_decode import decode_image
+
+# 解码像素缓存的默认容量（字节）
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+
+
+class ImageRecord:
+    """一张已导入的图片（不含完整像素）"""
+    __slots__ = ("path", "file_name", "size", "mode", "mtime", "thumbnail", "record_id")
+
+    def __init__(self, path, size, mode, mtime, thumbnail=None):
+        self.path = path
+        self.file_name = os.path.basename(path)
+        self.size = size
+        self.mode = mode
+        self.mtime = mtime
+        self.thumbnail = thumbnail  # 缩略图（PhotoImage）
+        self.record_id = None  # 加入 ImageRegistry 时分配的编号
+
+    @property
+    def width(self):
+        return self.size[0]
+
+    @property
+    def height(self):
+        return self.size[1]
+
+    def __repr__(self):
+        return f"ImageRecord({self.path!r}, size={self.size}, mode={self.mode!r})"
+
+
+def normalize_path(path):
+    """规范化路径（解析符号链接和相对路径，Windows上忽略大小写），用作查重的键"""
+    return os.path.normcase(os.path.realpath(path))
+
+
+class ImageRegistry:
+    """已导入图片的有序索引：位置 -> 记录，规范化路径 -> 记录，编号 -> 记录"""
+
+    def __init__(self):
+        self._records = []
+        self._by_path = {}
+        self._by_id = {}
+        self._positions = {}  # 编号 -> 在列表中的位置
+        self._next_id = 1
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def __getitem__(self, index):
+        return self._records[index]
+
+    def __contains__(self, path):
+        return normalize_path(path) in self._by_path
+
+    def add(self, record):
+        """加入一条记录并分配编号，同一文件已导入时返回False"""
+        key = normalize_path(record.path)
+        if key in self._by_path:
+            return False
+        record.record_id = self._next_id
+        self._next_id += 1
+        self._positions[record.record_id] = len(self._records)
+        self._records.append(record)
+        self._by_path[key] = record
+        self._by_id[record.record_id] = record
+        return True
+
+    def path_keys(self):
+        """所有已导入文件的规范化路径（副本，可交给其他线程使用）"""
+        return set(self._by_path)
+
+    def get_by_path(self, path):
+        """按路径查找记录，不存在时返回None"""
+        return self._by_path.get(normalize_path(path))
+
+    def get_by_id(self, record_id):
+        """按编号查找记录，不存在时返回None"""
+        return self._by_id.get(record_id)
+
+    def index_of(self, record_id):
+        """记录在列表中的位置，不存在时返回-1"""
+        return self._positions.get(record_id, -1)
+
+
+def estimate_image_bytes(img):
+    """估算解码后图片占用的内存"""
+    bits_per_pixel = {"1": 1, "L": 8, "P": 8, "I;16": 16}.get(img.mode, 8 * len(img.getbands()))
+    return img.width * img.height * bits_per_pixel // 8
+
+
+class PixelCache:
+    """按字节预算的LRU解码像素缓存（线程安全）"""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (路径, 修改时间) -> (图片, 字节数)
+        self._lock = threading.Lock()
+
+    def get(self, record):
+        """获取图片的完整像素，未缓存时解码（返回的图片只读，修改前请先copy）"""
+        key = (record.path, record.mtime)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        # 在锁外解码，避免阻塞其他线程
+        img = decode_image(record.path)
+        self.put(key, img)
+        return img
+
+    def put(self, key, img):
+        """放入缓存，超出预算时淘汰最久未使用的图片"""
+        size = estimate_image_bytes(img)
+        if size > self.max_bytes:
+            return  # 单张超过预算的图片不缓存
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._entries[key] = (img, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def discard(self, path):
+        """移除某个文件的所有缓存"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                self.current_bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
@@ -0,0 +1,269 @@
+"""
+流水线并行导出
+
+导出分为三个阶段，由队列连接，三个阶段合计持有的图片数有固定上限：
+  读取线程：按顺序预读原图文件的字节
+  处理进程：解码 -> 调整尺寸 -> 水印 -> 编码为字节（多进程）
+  写入线程：把编码结果写入输出文件
+磁盘读写与CPU计算相互重叠；每个阶段统计忙碌时间，用于判断导出受限于I/O还是CPU。
+串行与并行使用同一组阶段函数，输出逐字节一致。
+增量导出时根据输出文件夹中的清单跳过原图和参数都没有变化的图片（见 export_manifest）。
+"""
+import io
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from PIL import Image
+
+import render_engine
+from export_manifest import IncrementalPlan
+
+# 单张图片的导出任务
+ExportTask = namedtuple("ExportTask", ["source_path", "output_path", "spec"])
+
+# 各阶段的忙碌时间（秒），cpu_time 为所有处理进程的合计
+PipelineStats = namedtuple("PipelineStats", ["wall_time", "read_time", "cpu_time", "write_time", "workers"])
+
+# 单张图片的编码耗时（秒）和输出字节数
+ImageStats = namedtuple("ImageStats", ["source_path", "output_path", "encode_time", "output_bytes"])
+
+# 导出结果  errors 为 [(原图路径, 错误信息), ...]，skipped_count 为增量导出时跳过的已是最新的图片数，
+# image_stats 为每张导出成功的图片的 ImageStats（按任务顺序）
+ExportResult = namedtuple("ExportResult", ["success_count", "errors", "cancelled", "skipped_count", "stats",
+                                           "image_stats"],
+                          defaults=(0, None, ()))
+
+
+def default_workers():
+    """默认进程数：CPU核心数"""
+    return os.cpu_count() or 1
+
+
+def stage_utilization(stats):
+    """各阶段的利用率（0~1）：读取、处理（按进程数平均）、写入"""
+    wall = max(stats.wall_time, 1e-9)
+    return {
+        "read": stats.read_time / wall,
+        "cpu": stats.cpu_time / (wall * max(1, stats.workers)),
+        "write": stats.write_time / wall,
+    }
+
+
+def read_source(source_path):
+    """读取阶段：读取原图文件的全部字节"""
+    with open(source_path, "rb") as f:
+        return f.read()
+
+
+def render_source(data, spec):
+    """处理阶段：从字节解码、渲染并编码，返回 (输出文件的字节, 编码耗时)"""
+    with Image.open(io.BytesIO(data)) as img:
+        # 打开的图片只在这里使用，直接作为工作图片合成水印
+        final_img = render_engine.render_image(img, spec, in_place=True)
+        if final_img is img:
+            final_img.load()  # 不调整尺寸也不加水印时，解码不计入编码耗时
+        start = time.perf_counter()
+        encoded = render_engine.encode_image(final_img, spec.output)
+        return encoded, time.perf_counter() - start
+
+
+def write_output(output_path, data):
+    """写入阶段：写入输出文件"""
+    with open(output_path, "wb") as f:
+        f.write(data)
+
+
+def export_image(source_path, output_path, spec):
+    """导出单张图片：读取 -> 渲染 -> 保存"""
+    write_output(output_path, render_source(read_source(source_path), spec)[0])
+
+
+def _render_task(data, spec):
+    """子进程入口，返回 (编码结果, 错误信息, 总耗时, 编码耗时)，异常转为字符串（避免异常对象无法序列化）"""
+    start = time.perf_counter()
+    try:
+        encoded, encode_time = render_source(data, spec)
+        return encoded, None, time.perf_counter() - start, encode_time
+    except Exception as e:
+        return None, str(e) or type(e).__name__, time.perf_counter() - start, 0.0
+
+
+def run_export(tasks, workers=1, on_progress=None, cancel_event=None, incremental=False):
+    """
+    执行导出任务
+
+    workers <= 1 时在当前线程依次执行三个阶段；否则使用读取线程 + 进程池 + 写入线程的流水线，
+    已读取但尚未写入的图片（读取队列、处理中、写入队列合计）最多为 workers 的两倍张。
+    on_progress(已完成数, 总数, 任务, 错误信息) 在每张图片写入后调用（总数不含跳过的图片）；
+    cancel_event 被设置后不再读取新图片，已读取的图片会处理完并写入。
+    incremental 为True时跳过已是最新的输出，并在每个输出文件夹的清单中记录导出成功的图片。
+    """
+    plan = None
+    skipped_count = 0
+    if incremental:
+        plan = IncrementalPlan()
+        tasks, skipped = plan.split(tasks)
+        skipped_count = len(skipped)
+
+    total = len(tasks)
+    done = 0
+    success_count = 0
+    errors = []
+    image_stats = []
+    times = {"read": 0.0, "cpu": 0.0, "write": 0.0}
+    start_time = time.perf_counter()
+
+    def cancelled():
+        return cancel_event is not None and cancel_event.is_set()
+
+    def read(task):
+        """执行读取阶段，返回 (字节, 错误信息)"""
+        start = time.perf_counter()
+        try:
+            return read_source(task.source_path), None
+        except OSError as e:
+            return None, str(e)
+        finally:
+            times["read"] += time.perf_counter() - start
+
+    def write_and_finish(index, task, data, error, encode_time=0.0):
+        """执行写入阶段并记录结果"""
+        nonlocal done, success_count
+        if error is None:
+            start = time.perf_counter()
+            try:
+                write_output(task.output_path, data)
+            except OSError as e:
+                error = str(e)
+            times["write"] += time.perf_counter() - start
+
+        done += 1
+        if error is None:
+            success_count += 1
+            image_stats.append((index, ImageStats(task.source_path, task.output_path, encode_time, len(data))))
+            if plan is not None:
+                plan.record(task)
+        else:
+            errors.append((index, task.source_path, error))
+        if on_progress:
+            on_progress(done, total, task, error)
+
+    if workers <= 1 or total <= 1:
+        workers = 1
+        for index, task in enumerate(tasks):
+            if cancelled():
+                break
+            data, error = read(task)
+            encode_time = 0.0
+            if error is None:
+                data, error, seconds, encode_time = _render_task(data, task.spec)
+                times["cpu"] += seconds
+            write_and_finish(index, task, data, error, encode_time)
+    else:
+        workers = min(workers, total)
+        # 读取线程每读取一张图片占用一个名额，写入线程写完后归还，三个阶段合计不超过 max_buffered 张
+        max_buffered = workers * 2
+        slots = threading.Semaphore(max_buffered)
+        read_queue = queue.Queue()  # 读取线程 -> 分发
+        write_queue = queue.Queue()  # 分发 -> 写入线程
+        stop = threading.Event()  # 分发或写入出错时通知读取线程停止
+        failures = []  # 后台线程中的意外异常，结束后在调用方重新抛出
+
+        def reader():
+            try:
+                for index, task in enumerate(tasks):
+                    while not slots.acquire(timeout=0.1):
+                        if stop.is_set():
+                            return
+                    if cancelled() or stop.is_set():
+                        slots.release()
+                        break
+                    data, error = read(task)
+                    read_queue.put((index, task, data, error))
+            except Exception as e:
+                failures.append(e)
+            finally:
+                read_queue.put(None)
+
+        def writer():
+            failed = False
+            while True:
+                item = write_queue.get()
+                if item is None:
+                    break
+                try:
+                    if not failed:  # 出错后只归还名额，不再写入
+                        write_and_finish(*item)
+                except Exception as e:
+                    failures.append(e)
+                    failed = True
+                    stop.set()
+                finally:
+                    slots.release()
+
+        reader_thread = threading.Thread(target=reader, daemon=True)
+        writer_thread = threading.Thread(target=writer, daemon=True)
+        reader_thread.start()
+        writer_thread.start()
+
+        try:
+            # 使用spawn启动子进程：主进程中有Tk和后台线程，fork并不安全
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                pending = {}
+                reader_done = False
+                while True:
+                    # 从读取队列补充任务（有在途任务时不阻塞等待读取）
+                    while not reader_done:
+                        try:
+                            item = read_queue.get(block=not pending)
+                        except queue.Empty:
+                            break
+                        if item is None:
+                            reader_done = True
+                            break
+                        index, task, data, error = item
+                        if error is not None:
+                            write_queue.put((index, task, None, error))
+                        else:
+                            pending[executor.submit(_render_task, data, task.spec)] = (index, task)
+                    if not pending:
+                        if reader_done:
+                            break
+                        continue
+
+                    finished, _ = wait(pending, timeout=None if reader_done else 0.05,
+                                       return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        index, task = pending.pop(future)
+                        try:
+                            data, error, seconds, encode_time = future.result()
+                            times["cpu"] += seconds
+                        except Exception as e:  # 子进程异常退出等
+                            data, error, encode_time = None, str(e), 0.0
+                        write_queue.put((index, task, data, error, encode_time))
+        finally:
+            # 出错时同样让读取线程停止、写入线程写完已完成的图片后退出，不留下阻塞的线程
+            stop.set()
+            write_queue.put(None)
+            reader_thread.join()
+            writer_thread.join()
+        if failures:
+            raise failures[0]
+
+    stats = PipelineStats(time.perf_counter() - start_time, times["read"], times["cpu"], times["write"], workers)
+
+    # 按任务顺序整理错误，保证与进程数无关
+    errors.sort(key=lambda item: item[0])
+    errors = [(path, error) for _, path, error in errors]
+    image_stats.sort(key=lambda item: item[0])
+    image_stats = tuple(item for _, item in image_stats)
+    if plan is not None:
+        # 取消时同样保存，已完成的图片下次不必重新导出
+        errors.extend(plan.save())
+    return ExportResult(success_count, errors, cancelled() and done < total, skipped_count, stats, image_stats)
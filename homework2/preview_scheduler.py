@@ -0,0 +1,117 @@
+"""
+预览刷新调度
+
+界面上的多个设置变化（例如加载模板时连续设置十几个变量）只标记预览需要刷新，
+在事件循环空闲时合并为一次渲染；渲染本身在后台线程中执行，只显示最新一次请求的结果。
+"""
+import queue
+import threading
+
+
+class PreviewScheduler:
+    """合并同一轮事件循环内的预览刷新请求"""
+
+    def __init__(self, widget, render, delay_ms=0):
+        self.widget = widget  # 用于 after/after_idle 的Tk控件
+        self.render = render  # 实际执行渲染的函数
+        self.delay_ms = delay_ms  # 大于0时为防抖延迟（毫秒），否则在空闲时立即渲染
+        self.requested = 0  # 收到的刷新请求数
+        self.rendered = 0  # 实际执行的渲染次数
+        self._pending = None  # 已安排但尚未执行的回调ID
+
+    @property
+    def skipped(self):
+        """被合并掉的渲染次数"""
+        return self.requested - self.rendered - (1 if self._pending is not None else 0)
+
+    def request(self):
+        """标记预览需要刷新"""
+        self.requested += 1
+        if self._pending is not None:
+            if self.delay_ms <= 0:
+                return
+            # 防抖：重新计时
+            self.widget.after_cancel(self._pending)
+        if self.delay_ms > 0:
+            self._pending = self.widget.after(self.delay_ms, self._run)
+        else:
+            self._pending = self.widget.after_idle(self._run)
+
+    def flush(self):
+        """如果有待执行的刷新，立即执行"""
+        if self._pending is not None:
+            self.widget.after_cancel(self._pending)
+            self._run()
+
+    def cancel(self):
+        """取消待执行的刷新"""
+        if self._pending is not None:
+            self.widget.after_cancel(self._pending)
+            self._pending = None
+
+    def _run(self):
+        self._pending = None
+        self.rendered += 1
+        self.render()
+
+
+class BackgroundRenderer:
+    """在后台线程中执行渲染任务，每个任务带递增的代号，只把最新代号的结果交回Tk线程
+
+    尚未开始的旧任务会被新任务直接替换，已在执行的旧任务完成后结果被丢弃
+    """
+
+    def __init__(self, widget, on_done, poll_ms=15):
+        self.widget = widget
+        self.on_done = on_done  # on_done(结果, 异常) 在Tk线程中调用
+        self.poll_ms = poll_ms
+        self.generation = 0  # 最新请求的代号
+        self.dropped = 0  # 被替换或结果被丢弃的任务数
+        self._delivered = 0  # 已交回Tk线程的最新代号
+        self._request = None  # 等待执行的 (代号, 任务)
+        self._condition = threading.Condition()
+        self._results = queue.Queue()  # 后台线程 -> Tk线程
+        self._polling = False
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, job):
+        """提交渲染任务（无参数的函数，返回渲染结果），替换尚未开始的旧任务"""
+        with self._condition:
+            self.generation += 1
+            if self._request is not None:
+                self.dropped += 1
+            self._request = (self.generation, job)
+            self._condition.notify()
+        if not self._polling:
+            self._polling = True
+            self.widget.after(self.poll_ms, self._poll)
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while self._request is None:
+                    self._condition.wait()
+                generation, job = self._request
+                self._request = None
+            try:
+                self._results.put((generation, job(), None))
+            except Exception as e:
+                self._results.put((generation, None, e))
+
+    def _poll(self):
+        """在Tk线程中取回结果，只处理最新代号的结果"""
+        while True:
+            try:
+                generation, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if generation == self.generation:
+                self._delivered = generation
+                self.on_done(result, error)
+            else:
+                self.dropped += 1
+
+        if self._delivered < self.generation:
+            self.widget.after(self.poll_ms, self._poll)
+        else:
+            self._polling = False
@@ -0,0 +1,604 @@
+"""
+无界面（不依赖Tk）的图片渲染引擎
+
+GUI 与批处理工具共用：输入一张图片和一个不可变、可哈希的渲染参数（RenderSpec），
+输出处理后的图片。所有参数都在 RenderSpec 中，因此可以在任意线程/进程中调用。
+"""
+import io
+import os
+import threading
+from collections import namedtuple, OrderedDict
+from functools import lru_cache
+
+from PIL import Image, ImageDraw
+
+import font_index
+from image_decode import downscale
+
+# 尺寸调整参数  method: none, width, height, percentage
+ResizeSpec = namedtuple("ResizeSpec", ["method", "width", "height", "percentage"],
+                        defaults=["none", 800, 600, 100])
+
+# 文本水印参数  color 为十六进制颜色，opacity 为 0-100
+TextWatermarkSpec = namedtuple("TextWatermarkSpec",
+                               ["text", "font_family", "font_size", "bold", "italic", "color", "opacity", "shadow"],
+                               defaults=["", "SimHei", 24, False, False, "#000000", 50, True])
+
+# 图片水印参数  scale 为百分比，opacity 为 0-100
+ImageWatermarkSpec = namedtuple("ImageWatermarkSpec", ["path", "scale", "opacity"],
+                                defaults=["", 50, 50])
+
+# 水印参数  type: none, text, image；x、y 为水印在（调整尺寸后）图片上的坐标
+WatermarkSpec = namedtuple("WatermarkSpec", ["type", "text", "image", "x", "y", "rotation"],
+                           defaults=["none", TextWatermarkSpec(), ImageWatermarkSpec(), 0, 0, 0])
+
+# 输出参数  format: png, jpeg, webp
+#   PNG:  png_compress_level 0-9（越大越小越慢），png_optimize 额外搜索最优压缩参数
+#   JPEG: jpeg_optimize 优化霍夫曼表，jpeg_progressive 渐进式，jpeg_subsampling 色度抽样 4:2:0/4:2:2/4:4:4，
+#         None 为不指定（由Pillow按图片模式决定，例如灰度和CMYK图片不做抽样）
+#   WebP: webp_lossless 无损，webp_method 0-6（越大越小越慢）
+#   max_bytes: 输出文件大小上限（字节），0为不限制；只对JPEG和有损WebP有效，
+#              在不超过上限的前提下使用尽量高的质量（不高于 jpeg_quality/webp_quality）
+# 默认值与Pillow的默认编码参数一致
+OutputSpec = namedtuple("OutputSpec", ["format", "jpeg_quality", "png_compress_level", "png_optimize",
+                                       "jpeg_optimize", "jpeg_progressive", "jpeg_subsampling",
+                                       "webp_quality", "webp_lossless", "webp_method", "max_bytes"],
+                        defaults=["png", 95, 6, False, False, False, None, 80, False, 4, 0])
+
+OUTPUT_FORMATS = ("jpeg", "png", "webp")
+JPEG_SUBSAMPLING_OPTIONS = ("4:2:0", "4:2:2", "4:4:4")
+
+# 按文件大小搜索质量时的参数
+MIN_QUALITY = 0  # 与质量滑块的最小值一致（JPEG和WebP都接受0）
+SIZE_SAMPLE_PIXELS = 256 * 256  # 估算质量时试编码的缩小图的像素数
+SIZE_SEARCH_STEP = 2  # 从估算值出发扩展搜索区间的初始步长
+MAX_SIZE_SEARCH_ENCODES = 8  # 原尺寸试编码次数上限（不含第一次按设定质量的编码）
+
+# 完整的渲染参数
+RenderSpec = namedtuple("RenderSpec", ["resize", "watermark", "output"],
+                        defaults=[ResizeSpec(), WatermarkSpec(), OutputSpec()])
+
+# 预设位置的边距
+POSITION_MARGIN = 20
+
+
+class LRUCache:
+    """按条目数限制的线程安全LRU缓存"""
+
+    def __init__(self, maxsize=16):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """查找缓存，未命中时返回None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# 处理好的图片水印（缩放、透明度、旋转之后），一次批量导出只需准备一次
+_image_sprite_cache = LRUCache(maxsize=8)
+# 预先渲染好的文本水印
+_text_sprite_cache = LRUCache(maxsize=32)
+
+
+def load_font(family, size, bold=False, italic=False):
+    """加载水印字体（通过字体索引查找文件并缓存），找不到时使用默认字体"""
+    return font_index.get_font(family, size, bold, italic)
+
+
+@lru_cache(maxsize=8)
+def _load_watermark_source(path, mtime):
+    """按路径和修改时间缓存水印图片"""
+    with Image.open(path) as img:
+        return img.copy()
+
+
+def load_watermark_image(path):
+    """加载水印图片（同一文件只解码一次）"""
+    if not path:
+        return None
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    return _load_watermark_source(path, mtime)
+
+
+def parse_color(hex_color):
+    """解析十六进制颜色，失败时返回黑色"""
+    hex_color = hex_color.lstrip("#")
+    try:
+        return tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
+    except ValueError:
+        return 0, 0, 0
+
+
+def compute_resized_size(size, resize_spec):
+    """计算调整后的图片尺寸"""
+    original_width, original_height = size
+    method = resize_spec.method
+
+    if method == "width":
+        # 按宽度调整，保持比例
+        target_width = max(1, resize_spec.width)  # 确保至少1像素
+        ratio = target_width / original_width
+        return target_width, int(original_height * ratio)
+
+    if method == "height":
+        # 按高度调整，保持比例
+        target_height = max(1, resize_spec.height)  # 确保至少1像素
+        ratio = target_height / original_height
+        return int(original_width * ratio), target_height
+
+    if method == "percentage":
+        # 按百分比调整
+        ratio = max(1, min(1000, resize_spec.percentage)) / 100  # 限制在1-1000%
+        return int(original_width * ratio), int(original_height * ratio)
+
+    return original_width, original_height
+
+
+def resize_image(img, resize_spec):
+    """根据设置调整图片尺寸（不调整时直接返回原图片对象，不复制）"""
+    if resize_spec.method == "none":
+        return img
+    # 大幅缩小时使用缩小解码/reduce，放大时直接LANCZOS
+    return downscale(img, compute_resized_size(img.size, resize_spec))
+
+
+def measure_text(text_spec):
+    """计算文本水印的宽高"""
+    font = load_font(text_spec.font_family, text_spec.font_size, text_spec.bold, text_spec.italic)
+    text_bbox = font.getbbox(text_spec.text or " ")  # 防止空文本
+    return text_bbox[2] - text_bbox[0], text_bbox[3] - text_bbox[1]
+
+
+def scaled_watermark_size(watermark_image, scale):
+    """图片水印按百分比缩放后的宽高，至少为1像素（预览按比例缩小后可能不足1像素）"""
+    scale = scale / 100
+    return max(1, int(watermark_image.width * scale)), max(1, int(watermark_image.height * scale))
+
+
+def measure_watermark(watermark_spec, watermark_image=None):
+    """计算水印（未旋转）的宽高，无水印时返回None"""
+    if watermark_spec.type == "text":
+        return measure_text(watermark_spec.text)
+    if watermark_spec.type == "image":
+        if watermark_image is None:
+            watermark_image = load_watermark_image(watermark_spec.image.path)
+        if watermark_image is None:
+            return None
+        return scaled_watermark_size(watermark_image, watermark_spec.image.scale)
+    return None
+
+
+def compute_preset_position(img_size, wm_size, position, margin=POSITION_MARGIN):
+    """根据九宫格位置计算水印坐标"""
+    img_width, img_height = img_size
+    wm_width, wm_height = wm_size
+
+    if position == "top_left":
+        return margin, margin
+    if position == "top_center":
+        return (img_width - wm_width) // 2, margin
+    if position == "top_right":
+        return img_width - wm_width - margin, margin
+    if position == "middle_left":
+        return margin, (img_height - wm_height) // 2
+    if position == "center":
+        return (img_width - wm_width) // 2, (img_height - wm_height) // 2
+    if position == "middle_right":
+        return img_width - wm_width - margin, (img_height - wm_height) // 2
+    if position == "bottom_left":
+        return margin, img_height - wm_height - margin
+    if position == "bottom_center":
+        return (img_width - wm_width) // 2, img_height - wm_height - margin
+    # bottom_right
+    return img_width - wm_width - margin, img_height - wm_height - margin
+
+
+def _render_text_layer(size, origin, text, font, color):
+    """渲染单色文本层：RGB为文本颜色，alpha为字形覆盖率乘以透明度
+
+    直接在透明图片上绘制会把抗锯齿边缘的颜色和透明黑色混合，叠加后出现暗边，因此先画蒙版再填色
+    """
+    mask = Image.new('L', size, 0)
+    ImageDraw.Draw(mask).text(origin, text, font=font, fill=color[3])
+    layer = Image.new('RGBA', size, color[:3] + (0,))
+    layer.putalpha(mask)
+    return layer
+
+
+def text_layer_layout(text_bbox):
+    """文本图层的布局，返回 (图层尺寸, 文本绘制位置)
+
+    text_bbox 为字形相对绘制位置的范围，其上沿通常不为0（字体的行首空白），左沿可能为负；
+    图层覆盖整个字形范围并在右下留出阴影余量，避免字形被截断。
+    绘制位置即水印坐标在图层中的位置
+    """
+    left, top, right, bottom = text_bbox
+    origin = (max(0, -left), max(0, -top))
+    return (right + origin[0] + 20, bottom + origin[1] + 20), origin
+
+
+def prepare_text_watermark(text_spec, rotation):
+    """把文本（含阴影）预先渲染为RGBA图片，结果按 (文本参数, 旋转) 缓存
+
+    返回 (水印图片, 偏移)：水印图片已裁掉透明边缘，偏移为其左上角相对水印坐标的位置。
+    返回的图片被多次复用，调用方不能修改它
+    """
+    key = (text_spec, rotation)
+    cached = _text_sprite_cache.get(key)
+    if cached is not None:
+        return cached
+
+    # 1. 准备字体和颜色（带透明度）
+    text = text_spec.text
+    font = load_font(text_spec.font_family, text_spec.font_size, text_spec.bold, text_spec.italic)
+    r, g, b = parse_color(text_spec.color)
+    opacity = int(text_spec.opacity * 2.55)  # 转0-255
+    text_color = (r, g, b, opacity)
+    shadow_color = (0, 0, 0, int(opacity * 0.3))  # 半透明黑色阴影
+
+    # 2. 分别渲染阴影层和文本层再叠加（图层覆盖整个字形并留出阴影余量）
+    size, (origin_x, origin_y) = text_layer_layout(font.getbbox(text))
+    sprite = _render_text_layer(size, (origin_x, origin_y), text, font, text_color)
+    if text_spec.shadow:
+        sprite = Image.alpha_composite(_render_text_layer(size, (origin_x + 2, origin_y + 2), text, font,
+                                                          shadow_color), sprite)
+
+    # 3. 处理旋转
+    if rotation != 0:
+        sprite = sprite.rotate(rotation, expand=True, resample=Image.Resampling.BILINEAR)
+
+    # 4. 裁掉透明边缘，减少每张图片需要合成的像素
+    bbox = sprite.getchannel("A").getbbox()
+    if bbox is None:
+        result = (None, (0, 0))  # 完全透明（例如透明度为0）
+    else:
+        result = (sprite.crop(bbox), (bbox[0] - origin_x, bbox[1] - origin_y))
+    _text_sprite_cache.put(key, result)
+    return result
+
+
+def composite_sprite(img, sprite, position):
+    """把RGBA水印按透明度叠加到图片上（只处理水印覆盖的区域）"""
+    x, y = position
+    if img.mode == "RGBA":
+        # alpha_composite 不支持负坐标，先裁掉超出左上角的部分
+        left, top = max(0, -x), max(0, -y)
+        if left >= sprite.width or top >= sprite.height:
+            return
+        if left or top:
+            sprite = sprite.crop((left, top, sprite.width, sprite.height))
+        img.alpha_composite(sprite, (x + left, y + top))
+    else:
+        img.paste(sprite, (x, y), sprite)
+
+
+def add_text_watermark(img, watermark_spec, in_place=False):
+    """给图片添加文本水印（支持透明度、阴影、旋转），in_place=True 时直接修改 img"""
+    if not in_place:
+        img = img.copy()
+    # 空文本或完全透明时不添加水印
+    sprite, position = watermark_sprite(watermark_spec._replace(type="text"), img.size)
+    if sprite is not None:
+        composite_sprite(img, sprite, position)
+    return img
+
+
+def scale_alpha(watermark, opacity):
+    """按透明度（0-255）整体缩放RGBA图片的alpha通道（查表运算，不逐像素遍历）"""
+    alpha = watermark.getchannel("A").point(lambda a: int(a * opacity / 255))
+    watermark.putalpha(alpha)
+    return watermark
+
+
+def prepare_image_watermark(watermark_image, image_spec, rotation):
+    """生成缩放、调整透明度并旋转后的水印图片，结果按 (水印图片, 缩放, 透明度, 旋转) 缓存
+
+    返回的图片被多次复用，调用方不能修改它
+    """
+    key = (id(watermark_image), image_spec.scale, image_spec.opacity, rotation)
+    cached = _image_sprite_cache.get(key)
+    # 缓存中保留了源图片的引用，因此 id 不会被其他对象复用
+    if cached is not None and cached[0] is watermark_image:
+        return cached[1]
+
+    # 1. 缩放水印图片
+    watermark = watermark_image.resize(scaled_watermark_size(watermark_image, image_spec.scale),
+                                       Image.Resampling.LANCZOS)
+
+    # 2. 调整水印透明度
+    opacity = int(image_spec.opacity * 2.55)  # 转0-255
+    if watermark.mode != "RGBA":
+        watermark = watermark.convert("RGBA")
+    scale_alpha(watermark, opacity)
+
+    # 3. 处理旋转
+    if rotation != 0:
+        watermark = watermark.rotate(rotation, expand=True, resample=Image.Resampling.BILINEAR)
+
+    _image_sprite_cache.put(key, (watermark_image, watermark))
+    return watermark
+
+
+def add_image_watermark(img, watermark_spec, watermark_image=None, in_place=False):
+    """给图片添加图片水印（支持缩放、透明度、透明通道、旋转），in_place=True 时直接修改 img"""
+    if not in_place:
+        img = img.copy()
+    # 无水印图片时返回原图；叠加时保留PNG透明通道
+    sprite, position = watermark_sprite(watermark_spec._replace(type="image"), img.size, watermark_image)
+    if sprite is not None:
+        composite_sprite(img, sprite, position)
+    return img
+
+
+def apply_watermark(img, watermark_spec, watermark_image=None, in_place=False):
+    """根据水印类型给图片添加水印"""
+    if watermark_spec.type == "text":
+        return add_text_watermark(img, watermark_spec, in_place)
+    if watermark_spec.type == "image":
+        return add_image_watermark(img, watermark_spec, watermark_image, in_place)
+    return img
+
+
+def watermark_sprite(watermark_spec, img_size, watermark_image=None):
+    """水印图片及其左上角在图片中的位置 (水印图片, (x, y))，与 apply_watermark 的合成结果一致
+
+    无水印时返回 (None, None)；返回的水印图片被缓存复用，调用方不能修改它
+    """
+    if watermark_spec.type == "text":
+        if not watermark_spec.text.text:
+            return None, None
+        sprite, (offset_x, offset_y) = prepare_text_watermark(watermark_spec.text, watermark_spec.rotation)
+        if sprite is None:
+            return None, None
+        return sprite, (watermark_spec.x + offset_x, watermark_spec.y + offset_y)
+
+    if watermark_spec.type == "image":
+        if watermark_image is None:
+            watermark_image = load_watermark_image(watermark_spec.image.path)
+        if watermark_image is None:
+            return None, None
+        sprite = prepare_image_watermark(watermark_image, watermark_spec.image, watermark_spec.rotation)
+        # 确保水印不会超出图片范围太多
+        img_width, img_height = img_size
+        x = max(0, min(watermark_spec.x, img_width - 10))
+        y = max(0, min(watermark_spec.y, img_height - 10))
+        return sprite, (x, y)
+
+    return None, None
+
+
+def render_image(img, spec, watermark_image=None, in_place=False):
+    """执行完整的处理流程：调整尺寸 -> 添加水印
+
+    整个流程只使用一张工作图片：调整尺寸的结果直接作为工作图片，水印只在其覆盖的区域上合成。
+    不调整尺寸时，in_place=True 直接在 img 上合成水印（调用方不再需要原图时使用），
+    否则复制一次。不调整尺寸也不加水印时可能返回 img 本身。
+    """
+    working = resize_image(img, spec.resize)
+    if spec.watermark.type == "none":
+        return working
+
+    owned = in_place or working is not img
+    # 水印按RGB/RGBA合成，其他模式（P、L等）先转换，转换结果即为工作图片
+    if working.mode not in ("RGB", "RGBA"):
+        has_alpha = working.mode in ("LA", "PA", "La") or "transparency" in working.info
+        working = working.convert("RGBA" if has_alpha else "RGB")
+        owned = True
+    return apply_watermark(working, spec.watermark, watermark_image, in_place=owned)
+
+
+def compute_fit_scale(size, max_size):
+    """计算把图片缩小到 max_size 以内的比例（不放大）"""
+    return min(max_size[0] / size[0], max_size[1] / size[1], 1.0)
+
+
+def make_proxy(img, resize_spec, max_size, fast=False):
+    """生成适应 max_size 的低分辨率预览底图
+
+    直接从原图一步缩放到预览尺寸（不生成输出尺寸的中间图片），
+    返回 (底图, 底图相对输出尺寸的缩放比例)。不需要缩放时返回 img 本身。
+    fast=True 时先按整数倍 reduce 再双线性缩放（交互过程中的草图），否则使用LANCZOS
+    """
+    output_size = compute_resized_size(img.size, resize_spec)
+    scale = compute_fit_scale(output_size, max_size)
+    proxy_size = (max(1, int(output_size[0] * scale)), max(1, int(output_size[1] * scale)))
+    if proxy_size == img.size:
+        return img, scale
+    if fast:
+        return img.resize(proxy_size, Image.Resampling.BILINEAR, reducing_gap=1.0), scale
+    return downscale(img, proxy_size), scale
+
+
+def scale_watermark_spec(watermark_spec, scale):
+    """把水印参数换算到缩放后的坐标系（字号、图片水印缩放比例、坐标同比缩放）"""
+    if scale == 1:
+        return watermark_spec
+    return watermark_spec._replace(
+        text=watermark_spec.text._replace(font_size=max(1, round(watermark_spec.text.font_size * scale))),
+        image=watermark_spec.image._replace(scale=watermark_spec.image.scale * scale),
+        x=round(watermark_spec.x * scale),
+        y=round(watermark_spec.y * scale)
+    )
+
+
+def render_proxy(base, scale, watermark_spec, watermark_image=None):
+    """在预览底图上按比例合成水印（不修改底图），用于交互预览"""
+    spec = RenderSpec(watermark=scale_watermark_spec(watermark_spec, scale))
+    return render_image(base, spec, watermark_image)
+
+
+def prepare_for_output(img, output_spec):
+    """按输出格式转换图片模式（JPEG不支持透明通道，填充白色背景）"""
+    if output_spec.format.lower() == "jpeg":
+        if img.mode in ('RGBA', 'LA'):
+            background = Image.new(img.mode[:-1], img.size, (255, 255, 255) if img.mode == 'RGBA' else 255)
+            background.paste(img, img.split()[-1])
+            img = background
+        elif img.mode not in ('RGB', 'L', 'CMYK'):
+            img = img.convert('RGB')
+    return img
+
+
+def encoder_options(output_spec):
+    """按输出参数生成 Image.save 的格式名和编码参数"""
+    output_format = output_spec.format.lower()
+    if output_format == "jpeg":
+        options = {
+            "quality": output_spec.jpeg_quality,
+            "optimize": output_spec.jpeg_optimize,
+            "progressive": output_spec.jpeg_progressive,
+        }
+        if output_spec.jpeg_subsampling in JPEG_SUBSAMPLING_OPTIONS:
+            options["subsampling"] = output_spec.jpeg_subsampling
+        return "JPEG", options
+    if output_format == "webp":  # 保留透明通道
+        return "WEBP", {
+            "quality": output_spec.webp_quality,
+            "lossless": output_spec.webp_lossless,
+            "method": output_spec.webp_method,
+        }
+    # PNG（保留透明通道）
+    return "PNG", {
+        "compress_level": output_spec.png_compress_level,
+        "optimize": output_spec.png_optimize,
+    }
+
+
+def quality_option(output_spec):
+    """可按文件大小调节的质量参数名，不支持时返回None（PNG、无损WebP）"""
+    output_format = output_spec.format.lower()
+    if output_format == "jpeg":
+        return "jpeg_quality"
+    if output_format == "webp" and not output_spec.webp_lossless:
+        return "webp_quality"
+    return None
+
+
+def _encode(img, output_spec):
+    """编码已转换好模式的图片"""
+    buffer = io.BytesIO()
+    format_name, options = encoder_options(output_spec)
+    img.save(buffer, format_name, **options)
+    return buffer.getvalue()
+
+
+def estimate_quality(img, output_spec, max_bytes, full_bytes):
+    """用缩小图试编码估算满足大小上限的质量，返回估算值；图片本身很小时返回None
+
+    full_bytes 为原图按设定质量编码的大小。缩小图同样按设定质量编码，两者之比作为
+    缩小图到原图的字节换算系数（比按像素数换算准确），然后在缩小图上二分查找质量，
+    每次试编码只有原图的一小部分像素。
+    """
+    pixels = img.width * img.height
+    if pixels <= SIZE_SAMPLE_PIXELS * 4:
+        return None
+    ratio = (SIZE_SAMPLE_PIXELS / pixels) ** 0.5
+    sample = downscale(img, (max(1, round(img.width * ratio)), max(1, round(img.height * ratio))),
+                       Image.Resampling.BILINEAR)
+
+    option = quality_option(output_spec)
+    low, high = MIN_QUALITY, getattr(output_spec, option)
+    sample_budget = max_bytes * len(_encode(sample, output_spec)) / full_bytes
+    while low < high:
+        quality = (low + high + 1) // 2
+        if len(_encode(sample, output_spec._replace(**{option: quality}))) <= sample_budget:
+            low = quality
+        else:
+            high = quality - 1
+    return low
+
+
+def encode_within_size(img, output_spec):
+    """编码为不超过 max_bytes 的字节串，返回 (字节串, 使用的质量)
+
+    先按设定质量编码，满足上限时直接返回；否则以缩小图的估算值为起点，
+    在原尺寸上扩展出满足/不满足上限的区间后二分，试编码次数有上限。
+    试编码的质量在 MIN_QUALITY 和设定质量之间，最低质量仍超出上限时抛出 ValueError。
+    """
+    option = quality_option(output_spec)
+    max_quality = getattr(output_spec, option)
+    max_bytes = output_spec.max_bytes
+    img = prepare_for_output(img, output_spec)
+    encoded = {}
+
+    def encode(quality):
+        if quality not in encoded:
+            encoded[quality] = _encode(img, output_spec._replace(**{option: quality}))
+        return encoded[quality]
+
+    if len(encode(max_quality)) <= max_bytes:
+        return encoded[max_quality], max_quality
+
+    # fit: 已知满足上限的最高质量（MIN_QUALITY - 1 表示尚未找到），too_big: 已知超出上限的最低质量
+    fit, too_big = MIN_QUALITY - 1, max_quality
+    guess = estimate_quality(img, output_spec, max_bytes, len(encoded[max_quality]))
+    quality = (MIN_QUALITY + max_quality) // 2 if guess is None else guess
+    step = SIZE_SEARCH_STEP
+    last_fits = None
+    for _ in range(MAX_SIZE_SEARCH_ENCODES):
+        if too_big - fit <= 1:
+            break
+        quality = max(fit + 1, min(quality, too_big - 1))
+        fits = len(encode(quality)) <= max_bytes
+        if fits:
+            fit = quality
+        else:
+            too_big = quality
+        if step and last_fits is not None and fits != last_fits:
+            step = 0  # 越过了目标质量，区间已确定
+        last_fits = fits
+        if step:  # 沿同一方向按倍增的步长扩展
+            quality = quality + step if fits else quality - step
+            step *= 2
+        else:
+            quality = (fit + too_big) // 2
+
+    if fit < MIN_QUALITY:
+        data = encode(MIN_QUALITY)
+        if len(data) > max_bytes:
+            raise ValueError(f"最低质量编码后仍有 {len(data) / 1024:.0f} KB，"
+                             f"超过大小上限 {max_bytes / 1024:.0f} KB")
+        return data, MIN_QUALITY
+    return encoded[fit], fit
+
+
+def encode_image(img, output_spec):
+    """将图片编码为字节串（设置了大小上限且格式支持时按上限搜索质量）"""
+    if output_spec.max_bytes and quality_option(output_spec):
+        return encode_within_size(img, output_spec)[0]
+    return _encode(prepare_for_output(img, output_spec), output_spec)
+
+
+def save_image(img, fp, output_spec):
+    """按输出参数编码并保存图片，fp 可以是路径或文件对象"""
+    data = encode_image(img, output_spec)
+    if hasattr(fp, "write"):
+        fp.write(data)
+    else:
+        with open(fp, "wb") as f:
+            f.write(data)
@@ -0,0 +1,138 @@
+"""
+持久化缩略图缓存
+
+缩略图以PNG保存在用户目录下，文件名由 (路径, 文件大小, 修改时间, 缩略图尺寸) 计算得出，
+原图的尺寸和模式写在PNG文本块中，因此命中缓存时完全不需要打开原图。
+缓存总大小超过上限时，按最近使用时间淘汰。
+"""
+import hashlib
+import os
+import threading
+
+from PIL import Image, PngImagePlugin
+
+from image_decode import load_thumbnail
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".image_processor_cache", "thumbnails")
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+
+
+class ThumbnailCache:
+    """按 (路径, 文件大小, 修改时间) 缓存缩略图的磁盘缓存"""
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, thumb_size=(120, 120)):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.thumb_size = thumb_size
+        self.hits = 0
+        self.misses = 0
+        self._total_bytes = None  # 首次写入时统计
+        self._lock = threading.Lock()
+
+    def _cache_path(self, path, file_size, mtime):
+        """计算缓存文件路径"""
+        key = f"{os.path.realpath(path)}|{file_size}|{mtime}|{self.thumb_size[0]}x{self.thumb_size[1]}"
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + ".png")
+
+    def get(self, path, file_size, mtime):
+        """查找缓存，命中时返回 (缩略图, 原图尺寸, 原图模式)，否则返回None"""
+        cache_path = self._cache_path(path, file_size, mtime)
+        try:
+            with Image.open(cache_path) as cached:
+                cached.load()
+                width, height = map(int, cached.text["source_size"].split("x"))
+                mode = cached.text["source_mode"]
+                thumbnail = cached.copy()
+            os.utime(cache_path)  # 更新使用时间，用于LRU淘汰
+        except (OSError, KeyError, ValueError):
+            return None
+        return thumbnail, (width, height), mode
+
+    def put(self, path, file_size, mtime, thumbnail, size, mode):
+        """写入缓存（先写临时文件再替换，避免并发读到半个文件）"""
+        cache_path = self._cache_path(path, file_size, mtime)
+        info = PngImagePlugin.PngInfo()
+        info.add_text("source_size", f"{size[0]}x{size[1]}")
+        info.add_text("source_mode", mode)
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            temp_path = f"{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            image = thumbnail if thumbnail.mode in ("RGB", "RGBA", "L", "LA", "P") else thumbnail.convert("RGBA")
+            image.save(temp_path, "PNG", pnginfo=info)
+            os.replace(temp_path, cache_path)
+            written = os.path.getsize(cache_path)
+        except OSError as e:
+            print(f"写入缩略图缓存失败: {e}")
+            return
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan_total_bytes()
+            else:
+                self._total_bytes += written
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def load(self, path, stat=None):
+        """获取缩略图：先查缓存，未命中时缩小解码并写入缓存
+
+        stat 为已有的文件信息（例如目录扫描时得到的），省略时重新获取
+        返回 (缩略图, 原图尺寸, 原图模式, 修改时间)
+        """
+        if stat is None:
+            stat = os.stat(path)
+        cached = self.get(path, stat.st_size, stat.st_mtime)
+        if cached is not None:
+            with self._lock:
+                self.hits += 1
+            return cached + (stat.st_mtime,)
+
+        with self._lock:
+            self.misses += 1
+        thumbnail, size, mode = load_thumbnail(path, self.thumb_size)
+        self.put(path, stat.st_size, stat.st_mtime, thumbnail, size, mode)
+        return thumbnail, size, mode, stat.st_mtime
+
+    def _iter_cache_files(self):
+        """遍历所有缓存文件，产出 (路径, stat)"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        for sub_entry in os.scandir(self.cache_dir):
+            if not sub_entry.is_dir():
+                continue
+            for entry in os.scandir(sub_entry.path):
+                if entry.name.endswith(".png"):
+                    try:
+                        yield entry.path, entry.stat()
+                    except OSError:
+                        pass
+
+    def _scan_total_bytes(self):
+        """统计缓存总大小"""
+        return sum(stat.st_size for _, stat in self._iter_cache_files())
+
+    def _evict(self):
+        """按最近使用时间淘汰，直到总大小降到上限的80%"""
+        files = sorted(self._iter_cache_files(), key=lambda item: item[1].st_mtime)
+        target = self.max_bytes * 0.8
+        total = sum(stat.st_size for _, stat in files)
+        for cache_path, stat in files:
+            if total <= target:
+                break
+            try:
+                os.remove(cache_path)
+                total -= stat.st_size
+            except OSError:
+                pass
+        self._total_bytes = total
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            for cache_path, _ in list(self._iter_cache_files()):
+                try:
+                    os.remove(cache_path)
+                except OSError:
+                    pass
+            self._total_bytes = 0
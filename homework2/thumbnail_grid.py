@@ -0,0 +1,168 @@
+"""
+虚拟化的缩略图网格
+
+只为当前可见的几行创建单元格控件，滚动时复用这些控件显示其他图片；
+勾选状态保存在普通列表中（与图片列表一一对应），而不是保存在控件上。
+"""
+import math
+import sys
+import tkinter as tk
+from tkinter import ttk
+
+CELL_WIDTH = 150  # 单元格宽度（含间距）
+CELL_HEIGHT = 185  # 单元格高度（含间距）
+CELL_PADDING = 5
+
+
+class _Cell:
+    """一个可复用的单元格控件"""
+    __slots__ = ("frame", "var", "image_label", "name_label", "window", "index")
+
+
+class ThumbnailGrid:
+    """缩略图网格，items 中的元素需要有 thumbnail 和 file_name 属性"""
+
+    def __init__(self, parent, on_click, on_toggle=None):
+        self.on_click = on_click  # 点击图片时调用 on_click(索引)
+        self.on_toggle = on_toggle  # 勾选状态变化时调用 on_toggle(索引, 是否选中)
+        self.items = []  # 图片记录列表
+        self.selected = []  # 每张图片的勾选状态
+        self.current_index = -1  # 高亮显示的图片
+        self.columns = 4
+        self._cells = []
+
+        scrollbar = ttk.Scrollbar(parent, command=self.yview)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.canvas = tk.Canvas(parent, yscrollcommand=scrollbar.set, yscrollincrement=20)
+        self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.canvas.bind("<Configure>", self._on_configure)
+        self._bind_mousewheel(self.canvas)
+
+    # 数据
+    def set_items(self, items):
+        """设置图片列表（可以是同一个列表对象，追加后再次调用即可），新图片默认勾选"""
+        self.items = items
+        if len(self.selected) < len(items):
+            self.selected.extend([True] * (len(items) - len(self.selected)))
+        else:
+            del self.selected[len(items):]
+        self.refresh(force=True)
+
+    def selected_indices(self):
+        """所有勾选的图片索引"""
+        return [i for i, checked in enumerate(self.selected) if checked]
+
+    def select_all(self, checked=True):
+        """全选/全不选"""
+        self.selected = [checked] * len(self.items)
+        for cell in self._cells:
+            if cell.index >= 0:
+                cell.var.set(checked)
+
+    def set_current(self, index):
+        """切换高亮显示的图片，只更新受影响的两个单元格"""
+        old_index, self.current_index = self.current_index, index
+        for cell in self._cells:
+            if cell.index in (old_index, index):
+                cell.frame.configure(relief=tk.RAISED if cell.index == index else tk.FLAT)
+
+    # 滚动与布局
+    def yview(self, *args):
+        """滚动条回调"""
+        self.canvas.yview(*args)
+        self.refresh()
+
+    def _bind_mousewheel(self, widget):
+        if sys.platform.startswith("linux"):
+            widget.bind("<Button-4>", lambda e: self.yview("scroll", -3, "units"))
+            widget.bind("<Button-5>", lambda e: self.yview("scroll", 3, "units"))
+        else:
+            widget.bind("<MouseWheel>", self._on_mousewheel)
+
+    def _on_mousewheel(self, event):
+        # Windows上delta为120的倍数，macOS上为较小的整数
+        step = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        self.yview("scroll", -step * 3, "units")
+
+    def _on_configure(self, event):
+        # 宽度变化时重新计算列数，列数改变后所有单元格都需要重新定位
+        columns = max(1, event.width // CELL_WIDTH)
+        changed = columns != self.columns
+        self.columns = columns
+        self.refresh(force=changed)
+
+    def refresh(self, force=False):
+        """只为可见行分配单元格；force=True 时重新设置所有单元格内容"""
+        total = len(self.items)
+        rows = math.ceil(total / self.columns) if total else 0
+        self.canvas.configure(scrollregion=(0, 0, self.columns * CELL_WIDTH, rows * CELL_HEIGHT))
+
+        # 计算可见的索引范围
+        top = self.canvas.canvasy(0)
+        height = max(self.canvas.winfo_height(), CELL_HEIGHT)
+        first_row = max(0, int(top // CELL_HEIGHT))
+        last_row = int((top + height) // CELL_HEIGHT)
+        visible = range(min(total, first_row * self.columns), min(total, (last_row + 1) * self.columns))
+
+        # 已在显示可见索引的单元格保持不动，其余单元格重新分配
+        visible_set = set(visible)
+        assigned = {cell.index: cell for cell in self._cells if cell.index in visible_set}
+        free_cells = [cell for cell in self._cells if cell.index not in assigned]
+        for index in visible:
+            cell = assigned.get(index)
+            if cell is None:
+                cell = free_cells.pop() if free_cells else self._create_cell()
+                self._show(cell, index)
+            elif force:
+                self._show(cell, index)
+        for cell in free_cells:
+            cell.index = -1
+            self.canvas.itemconfigure(cell.window, state="hidden")
+
+    def _create_cell(self):
+        """创建一个单元格控件"""
+        cell = _Cell()
+        cell.index = -1
+        cell.frame = ttk.Frame(self.canvas, padding=str(CELL_PADDING), relief=tk.FLAT, borderwidth=2)
+        cell.var = tk.BooleanVar(value=True)
+        check = ttk.Checkbutton(cell.frame, variable=cell.var, command=lambda: self._on_check(cell))
+        check.pack(anchor=tk.NW)
+        cell.image_label = ttk.Label(cell.frame)
+        cell.image_label.pack(pady=(0, 5))
+        cell.name_label = ttk.Label(cell.frame, wraplength=120)
+        cell.name_label.pack()
+
+        # 点击图片切换预览
+        for widget in (cell.frame, cell.image_label, cell.name_label):
+            widget.bind("<Button-1>", lambda e: self.on_click(cell.index) if cell.index >= 0 else None)
+        for widget in (cell.frame, check, cell.image_label, cell.name_label):
+            self._bind_mousewheel(widget)
+
+        cell.window = self.canvas.create_window(0, 0, window=cell.frame, anchor=tk.NW,
+                                                width=CELL_WIDTH - 2 * CELL_PADDING,
+                                                height=CELL_HEIGHT - 2 * CELL_PADDING)
+        self._cells.append(cell)
+        return cell
+
+    def _show(self, cell, index):
+        """让单元格显示第 index 张图片"""
+        cell.index = index
+        item = self.items[index]
+        row, col = divmod(index, self.columns)
+        self.canvas.coords(cell.window, col * CELL_WIDTH + CELL_PADDING, row * CELL_HEIGHT + CELL_PADDING)
+        self.canvas.itemconfigure(cell.window, state="normal")
+
+        cell.image_label.configure(image=item.thumbnail)
+        # 文件名（显示部分，过长截断）
+        file_name = item.file_name
+        cell.name_label.configure(text=file_name if len(file_name) <= 15 else file_name[:12] + "...")
+        cell.var.set(self.selected[index])
+        cell.frame.configure(relief=tk.RAISED if index == self.current_index else tk.FLAT)
+
+    def _on_check(self, cell):
+        if cell.index < 0:
+            return
+        checked = cell.var.get()
+        self.selected[cell.index] = checked
+        if self.on_toggle:
+            self.on_toggle(cell.index, checked)
@@ -0,0 +1,120 @@
+"""
+水印几何
+
+按渲染时的实际方式（先绘制在图层上，再以图层中心旋转并扩展画布）计算水印在输出图片坐标系中
+的四边形和外接矩形，用于判断鼠标是否点中水印。几何信息只在水印参数或图片尺寸变化时重新计算，
+判断本身只做几次乘加，不创建图片、不加载字体。
+"""
+import math
+from collections import namedtuple
+
+import render_engine
+
+# polygon 为四个顶点 ((x, y), ...)，bbox 为 (左, 上, 右, 下)，均为输出图片坐标
+WatermarkGeometry = namedtuple("WatermarkGeometry", ["polygon", "bbox"])
+
+
+def rotation_matrix(size, rotation):
+    """与 Image.rotate(rotation, expand=True) 相同的计算，返回 (扩展后尺寸, 输出->输入的仿射矩阵)"""
+    w, h = size
+    angle = -math.radians(rotation % 360.0)
+    matrix = [round(math.cos(angle), 15), round(math.sin(angle), 15), 0.0,
+              round(-math.sin(angle), 15), round(math.cos(angle), 15), 0.0]
+
+    def transform(x, y):
+        a, b, c, d, e, f = matrix
+        return a * x + b * y + c, d * x + e * y + f
+
+    # 以图层中心旋转
+    matrix[2], matrix[5] = transform(-w / 2, -h / 2)
+    matrix[2] += w / 2
+    matrix[5] += h / 2
+    corners = [transform(x, y) for x, y in ((0, 0), (w, 0), (w, h), (0, h))]
+    new_w = math.ceil(max(x for x, _ in corners)) - math.floor(min(x for x, _ in corners))
+    new_h = math.ceil(max(y for _, y in corners)) - math.floor(min(y for _, y in corners))
+    matrix[2], matrix[5] = transform(-(new_w - w) / 2, -(new_h - h) / 2)
+    return (new_w, new_h), matrix
+
+
+def rotate_rect(rect, layer_size, rotation):
+    """图层中的矩形在旋转（扩展画布）后的四个顶点，坐标相对旋转后图层的左上角"""
+    left, top, right, bottom = rect
+    corners = ((left, top), (right, top), (right, bottom), (left, bottom))
+    if rotation % 360 == 0:
+        return corners
+    _, (a, b, c, d, e, f) = rotation_matrix(layer_size, rotation)
+    # 旋转矩阵的逆即其转置：输出 = Mᵀ · (输入 - 平移)
+    return tuple((a * (x - c) + d * (y - f), b * (x - c) + e * (y - f)) for x, y in corners)
+
+
+def _make_geometry(points, origin):
+    ox, oy = origin
+    polygon = tuple((ox + x, oy + y) for x, y in points)
+    xs = [x for x, _ in polygon]
+    ys = [y for _, y in polygon]
+    return WatermarkGeometry(polygon, (min(xs), min(ys), max(xs), max(ys)))
+
+
+def compute_geometry(watermark_spec, img_size, watermark_image=None):
+    """计算水印在输出图片中的几何信息，无水印时返回None（与 render_engine 的绘制方式一致）"""
+    if watermark_spec.type == "text":
+        text_spec = watermark_spec.text
+        if not text_spec.text:
+            return None
+        font = render_engine.load_font(text_spec.font_family, text_spec.font_size, text_spec.bold, text_spec.italic)
+        # 与 prepare_text_watermark 相同的图层布局；字形范围即文本的 bbox
+        left, top, right, bottom = font.getbbox(text_spec.text)
+        layer_size, (origin_x, origin_y) = render_engine.text_layer_layout((left, top, right, bottom))
+        rect = (left + origin_x, top + origin_y, right + origin_x, bottom + origin_y)
+        points = rotate_rect(rect, layer_size, watermark_spec.rotation)
+        return _make_geometry(points, (watermark_spec.x - origin_x, watermark_spec.y - origin_y))
+
+    if watermark_spec.type == "image":
+        size = render_engine.measure_watermark(watermark_spec, watermark_image)
+        if size is None:
+            return None
+        points = rotate_rect((0, 0) + size, size, watermark_spec.rotation)
+        # 与 add_image_watermark 相同的位置限制
+        img_width, img_height = img_size
+        x = max(0, min(watermark_spec.x, img_width - 10))
+        y = max(0, min(watermark_spec.y, img_height - 10))
+        return _make_geometry(points, (x, y))
+
+    return None
+
+
+def contains(geometry, x, y):
+    """点是否在水印的四边形内（先用外接矩形快速排除）"""
+    left, top, right, bottom = geometry.bbox
+    if not (left <= x <= right and top <= y <= bottom):
+        return False
+    # 凸四边形：点在每条边的同一侧
+    sign = 0
+    polygon = geometry.polygon
+    for i in range(len(polygon)):
+        x1, y1 = polygon[i]
+        x2, y2 = polygon[(i + 1) % len(polygon)]
+        cross = (x2 - x1) * (y - y1) - (y2 - y1) * (x - x1)
+        if cross != 0:
+            if sign == 0:
+                sign = 1 if cross > 0 else -1
+            elif (cross > 0) != (sign > 0):
+                return False
+    return True
+
+
+class GeometryCache:
+    """缓存最近一次计算的水印几何，参数不变时直接返回"""
+
+    def __init__(self):
+        self._key = None
+        self._geometry = None
+        self._watermark_image = None  # 保留引用，保证 id 不被复用
+
+    def get(self, watermark_spec, img_size, watermark_image=None):
+        key = (watermark_spec, img_size, id(watermark_image))
+        if key != self._key or watermark_image is not self._watermark_image:
+            self._geometry = compute_geometry(watermark_spec, img_size, watermark_image)
+            self._key = key
+            self._watermark_image = watermark_image
+        return self._geometry